@@ -3,7 +3,7 @@
 Vibe Web Terminal — User Management CLI
 
 Manage local users in auth.yaml. Passwords are stored as bcrypt hashes
-with random per-user salt (12 rounds).
+with random per-user salt (12 rounds, or bcrypt_cost from auth.yaml).
 
 Usage:
     python3 edit_user.py list                  List all users
@@ -26,6 +26,7 @@ import yaml
 
 CONFIG_PATH = Path(__file__).parent / "auth.yaml"
 EXAMPLE_PATH = Path(__file__).parent / "auth.yaml.example"
+DEFAULT_BCRYPT_COST = 12
 
 
 def load_config() -> dict:
@@ -67,6 +68,9 @@ def prompt_password(confirm: bool = True) -> str:
         if len(password) < 4:
             print("Password must be at least 4 characters.")
             continue
+        if len(password.encode("utf-8")) > 72:
+            print("Password must be at most 72 bytes (bcrypt's limit).")
+            continue
         if confirm:
             password2 = getpass.getpass("Confirm password: ")
             if password != password2:
@@ -75,11 +79,20 @@ def prompt_password(confirm: bool = True) -> str:
         return password
 
 
-def hash_password(password: str) -> str:
-    """Hash a password with bcrypt (random salt, 12 rounds)."""
+def get_bcrypt_cost(config: dict) -> int:
+    """Get the bcrypt cost factor from auth.yaml (default 12)."""
+    cost = config.get("bcrypt_cost", DEFAULT_BCRYPT_COST)
+    if not isinstance(cost, int) or not 4 <= cost <= 15:
+        print(f"Error: bcrypt_cost must be an integer from 4 to 15, got {cost!r}.")
+        sys.exit(1)
+    return cost
+
+
+def hash_password(password: str, cost: int = DEFAULT_BCRYPT_COST) -> str:
+    """Hash a password with bcrypt (random salt, 2^cost rounds)."""
     return bcrypt.hashpw(
         password.encode("utf-8"),
-        bcrypt.gensalt(rounds=12),
+        bcrypt.gensalt(rounds=cost),
     ).decode("utf-8")
 
 
@@ -120,7 +133,7 @@ def cmd_add(args: argparse.Namespace) -> None:
     password = prompt_password()
 
     users[username] = {
-        "password_hash": hash_password(password),
+        "password_hash": hash_password(password, get_bcrypt_cost(config)),
         "created_at": datetime.now().isoformat(timespec="seconds"),
     }
     config["users"] = users
@@ -162,7 +175,7 @@ def cmd_passwd(args: argparse.Namespace) -> None:
     print(f"Changing password for '{username}'.")
     password = prompt_password()
 
-    users[username]["password_hash"] = hash_password(password)
+    users[username]["password_hash"] = hash_password(password, get_bcrypt_cost(config))
     config["users"] = users
     save_config(config)
     print(f"Password updated for '{username}'.")
@@ -7,26 +7,38 @@ Each user gets a unique session with a persistent container they can return to.
 """
 
 import asyncio
-import io
+import errno
+import heapq
 import json
 import logging
 import os
 import secrets
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from collections import OrderedDict
 from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum, auto
 from pathlib import Path
 from typing import Optional
+from urllib.parse import urlparse
 
-import aiofiles
 import aiodocker
 import aiodocker.exceptions
 import httpx
-from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile, WebSocket, WebSocketDisconnect
+import py7zr
+import websockets
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.background import BackgroundTask
 from starlette.websockets import WebSocketState
 
 try:
@@ -46,15 +58,29 @@ SERVER_PORT = 8081
 # Configuration
 DOCKER_IMAGE = "vibe-terminal:latest"
 CONTAINER_PREFIX = "vibe-session-"
+SESSION_ID_LABEL = "vibe.session_id"  # Container labels read back by session recovery
+SESSION_PORT_LABEL = "vibe.port"
 VIBE_MODE = "local"  # "local" (Ollama) or "cloud" (Mistral API) — set via --vibe-mode
 AGENT_CLI = "vibe"  # "vibe", "opencode", or "qwen" — set via --agent-cli
 MAX_SESSIONS_PER_USER = 3
 # No automatic cleanup - containers persist until user deletes them
 SESSION_TIMEOUT_HOURS = None  # Disabled
 CLEANUP_INTERVAL_SECONDS = 300  # 5 minutes (only cleans up dead containers)
+CLEANUP_RECHECK_SECONDS = 30  # Re-check interval for containers that look unhealthy
 AUTH_SESSION_CLEANUP_INTERVAL_SECONDS = 3600  # 1 hour (cleans up expired auth sessions)
 HOST_PORT_START = 17000
 HOST_PORT_END = 18000
+CONTAINER_VERIFY_TTL_SECONDS = 5.0  # Trust a verified-running container this long
+PORT_PROBE_BATCH = 32  # Concurrent bind() probes when /proc/net is unavailable
+UPLOAD_WRITE_BATCH = 1024 * 1024  # Upload bytes parsed per worker-thread hop
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # Archive bytes read per worker-thread hop
+ARCHIVE_LZMA_PRESET = 1  # Fast LZMA2 level for download archives
+DIR_SIZE_CACHE_SECONDS = 10.0  # Max age of a cached directory size
+DIR_SIZE_CACHE_ENTRIES = 4096
+OWNER_STORE_SAVE_DELAY_SECONDS = 0.1  # Coalesce owner store writes within this window
+TTYD_READY_TIMEOUT_SECONDS = 10.0  # Max wait for ttyd to answer after container start
+TTYD_READY_POLL_SECONDS = 0.05
+WS_BATCH_MAX_BYTES = 64 * 1024  # Cap on ttyd OUTPUT frames merged into one browser frame
 
 # Data directory: persistent storage within the project (survives reboots)
 DATA_DIR = Path(__file__).parent.parent / "data"
@@ -70,12 +96,100 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 # Docker client (initialized in lifespan)
 docker_client: aiodocker.Docker | None = None
 
+# Container name -> State.Status, kept current by watch_container_events()
+container_status: dict[str, str] = {}
+
+# (name, delay) of containers that died or were removed, for cleanup_old_sessions()
+# to check after delay seconds
+container_exits: asyncio.Queue[tuple[str, float]] = asyncio.Queue()
+
+# State.Status implied by each container lifecycle event
+_EVENT_STATUS = {
+    "create": "created",
+    "start": "running",
+    "restart": "running",
+    "unpause": "running",
+    "pause": "paused",
+    "stop": "exited",
+    "die": "exited",
+}
+
+# Directory path -> (st_mtime_ns, time.monotonic() when computed, size); LRU order.
+# Used from worker threads, hence the lock.
+_dir_size_cache: OrderedDict[str, tuple[int, float, int]] = OrderedDict()
+_dir_size_lock = threading.Lock()
+
+
+def monotonic_to_datetime(ts: float) -> datetime:
+    """Convert a time.monotonic() timestamp to a wall-clock datetime for display."""
+    return datetime.now() - timedelta(seconds=time.monotonic() - ts)
+
 
 def is_container_not_found(e: Exception) -> bool:
     """Check if exception indicates container not found."""
     return isinstance(e, aiodocker.exceptions.DockerError) and e.status == 404
 
 
+async def get_container_status(container_name: str) -> str | None:
+    """Get a container's State.Status, or None if the container does not exist.
+
+    Answered from the Docker events cache when possible; names not cached yet
+    fall back to inspecting the container. Other Docker errors propagate.
+    """
+    status = container_status.get(container_name)
+    if status is not None:
+        return status
+    try:
+        container = await docker_client.containers.get(container_name)
+        info = await container.show()
+    except aiodocker.exceptions.DockerError as e:
+        if is_container_not_found(e):
+            return None
+        raise
+    return info["State"]["Status"]
+
+
+async def get_container_statuses(container_names: list[str]) -> dict[str, str]:
+    """Get State.Status for several containers; containers that don't exist are left out.
+
+    Names in the Docker events cache are answered from it; if any are not
+    cached, a single container listing covers all of them. Docker errors
+    propagate.
+    """
+    wanted = set(container_names)
+    statuses = {}
+    for name in wanted:
+        status = container_status.get(name)
+        if status is not None:
+            statuses[name] = status
+    if len(statuses) < len(wanted):
+        containers = await docker_client.containers.list(
+            all=True, filters={"name": [CONTAINER_PREFIX]}
+        )
+        for container in containers:
+            name = container["Names"][0].lstrip("/")
+            if name in wanted and name not in statuses:
+                statuses[name] = container["State"]
+    return statuses
+
+
+async def wait_for_ttyd(port: int) -> bool:
+    """Poll a container's ttyd port until it answers HTTP.
+
+    Returns False if ttyd is still not answering after TTYD_READY_TIMEOUT_SECONDS.
+    """
+    client = await get_http_client()
+    deadline = time.monotonic() + TTYD_READY_TIMEOUT_SECONDS
+    while True:
+        try:
+            await client.get(f"http://127.0.0.1:{port}/", timeout=0.5)
+            return True
+        except httpx.HTTPError:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(TTYD_READY_POLL_SECONDS)
+
+
 async def delete_workspace(workspace: Path, session_id_prefix: str = "") -> bool:
     """Delete a workspace directory, using Docker as root if normal deletion fails.
 
@@ -84,12 +198,12 @@ async def delete_workspace(workspace: Path, session_id_prefix: str = "") -> bool
     if not workspace.exists():
         return True
 
-    import shutil
     label = session_id_prefix or workspace.name[:12]
 
-    # Try normal deletion first (works when UIDs match)
+    # Try normal deletion first (works when UIDs match); large trees take a
+    # while to walk, so keep it off the event loop
     try:
-        shutil.rmtree(workspace)
+        await asyncio.to_thread(shutil.rmtree, workspace)
         return True
     except PermissionError:
         logger.warning(f"Permission denied deleting {label}, trying Docker as root...")
@@ -141,7 +255,7 @@ class SessionError(Exception):
     pass
 
 
-@dataclass
+@dataclass(slots=True)
 class Session:
     """
     Represents a terminal session with state machine and reference counting.
@@ -155,11 +269,19 @@ class Session:
     port: int | None = None
     workspace: str | None = None
     created_at: datetime = field(default_factory=datetime.now)
-    last_accessed: datetime = field(default_factory=datetime.now)
+    last_accessed: float = field(default_factory=time.monotonic)
 
     _state: SessionState = SessionState.CREATING
     _ref_count: int = 0  # Active WebSocket connections
-    _lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    _last_verified: float = 0.0  # time.monotonic() of the last confirmed-running check
+    _resolved_workspace: Path | None = None
+
+    @property
+    def resolved_workspace(self) -> Path:
+        """Workspace directory with symlinks resolved (resolved once, on first use)."""
+        if self._resolved_workspace is None:
+            self._resolved_workspace = Path(self.workspace).resolve()
+        return self._resolved_workspace
 
     def can_delete(self) -> bool:
         """Check if session can be deleted (READY state and no active refs)."""
@@ -182,102 +304,198 @@ class SessionManager:
     Manages sessions with proper concurrency control.
 
     Lock ordering (to prevent deadlocks):
-        1. _global_lock (global)
-        2. session._lock (per-session)
+        1. _session_locks[session_id] (per-session ID)
+        2. _global_lock (global)
+
+    Critical sections without an await (ref counting, timestamps, state
+    flips) take no lock: coroutines cannot interleave inside them. The
+    global lock exists because port allocation can await; delete_session
+    still takes it so it never sees a session whose port is mid-allocation.
     """
 
     def __init__(self):
         self._sessions: dict[str, Session] = {}
-        self._global_lock = asyncio.Lock()  # For creation/deletion
+        self._global_lock = asyncio.Lock()  # For session table and port changes
+        self._session_locks: dict[str, asyncio.Lock] = {}  # Per-session-ID get/create
+        self._by_container: dict[str, str] = {}  # Container name -> session ID
         self._port_allocations: set[int] = set()
+        # Min-heap of candidate ports; allocated ports are popped, released ones pushed back
+        self._free_ports: list[int] = list(range(HOST_PORT_START, HOST_PORT_END))
+        heapq.heapify(self._free_ports)
 
     def _is_port_in_use(self, port: int) -> bool:
         """Check if a port is actually in use on the system."""
-        import socket
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            # Lingering TIME_WAIT connections don't make a port unavailable to Docker
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             try:
                 s.bind(("0.0.0.0", port))
                 return False
             except OSError:
                 return True
 
-    def _allocate_port(self) -> int:
-        """Allocate an available port for a container."""
-        for port in range(HOST_PORT_START, HOST_PORT_END):
-            if port not in self._port_allocations and not self._is_port_in_use(port):
-                self._port_allocations.add(port)
-                return port
-        raise RuntimeError("No available ports")
+    def _snapshot_used_ports(self) -> frozenset[int] | None:
+        """Get all local TCP ports in use from /proc/net, or None if unavailable."""
+        used = set()
+        found = False
+        for table in ("/proc/net/tcp", "/proc/net/tcp6"):
+            try:
+                with open(table) as f:
+                    next(f, None)  # Header
+                    for line in f:
+                        local_address = line.split(None, 2)[1]
+                        used.add(int(local_address.rsplit(":", 1)[1], 16))
+                found = True
+            except (OSError, IndexError, ValueError):
+                continue
+        return frozenset(used) if found else None
+
+    async def _allocate_port(self, used: frozenset[int] | None) -> int:
+        """Allocate the lowest available port for a container.
+
+        used is a _snapshot_used_ports() result, taken by the caller in a
+        worker thread so reading /proc/net neither blocks the event loop nor
+        holds the global lock. Without it, candidates are bind-probed
+        concurrently in worker threads instead.
+        """
+        batch_size = 1 if used is not None else PORT_PROBE_BATCH
+        port = None
+        unused: list[int] = []  # Popped but not allocated; go back on the heap
+        try:
+            while port is None and self._free_ports:
+                batch = []
+                while self._free_ports and len(batch) < batch_size:
+                    candidate = heapq.heappop(self._free_ports)
+                    if candidate not in self._port_allocations:
+                        batch.append(candidate)
+                unused.extend(batch)
+                if used is not None:
+                    in_use = [candidate in used for candidate in batch]
+                else:
+                    loop = asyncio.get_running_loop()
+                    in_use = await asyncio.gather(*(
+                        loop.run_in_executor(None, self._is_port_in_use, candidate)
+                        for candidate in batch
+                    ))
+                port = next((c for c, taken in zip(batch, in_use) if not taken), None)
+            if port is None:
+                raise RuntimeError("No available ports")
+            unused.remove(port)
+            self._port_allocations.add(port)
+            return port
+        finally:
+            for candidate in unused:
+                heapq.heappush(self._free_ports, candidate)
 
     def _release_port(self, port: int) -> None:
         """Release a port allocation."""
-        self._port_allocations.discard(port)
+        if port in self._port_allocations:
+            self._port_allocations.discard(port)
+            heapq.heappush(self._free_ports, port)
 
     async def get_or_create_session(self, session_id: str) -> Session:
         """
         Get existing or create new session (prevents duplicates).
 
-        Uses double-check locking pattern for efficiency.
+        Lookup, liveness check and creation for one session ID run under that
+        ID's lock, so concurrent callers never observe a half-made decision.
+        The global lock is only taken for session table and port changes.
+
+        The exception is a READY session whose container was verified within
+        CONTAINER_VERIFY_TTL_SECONDS, returned without the lock. The state
+        check and the return have no await between them, so a session the
+        locked path has already flipped to DELETING is never returned. The
+        locked path may still be awaiting Docker before that flip, and the
+        container may have died since it was verified; such a session is
+        one a locked caller could equally have been handed just before the
+        container died, and the next call after the TTL replaces it.
         """
-        # Fast path: existing READY session
+        # Fast path: READY session whose container was verified recently
         session = self._sessions.get(session_id)
         if session and session._state == SessionState.READY:
-            async with session._lock:
-                session.last_accessed = datetime.now()
-                # Verify container is still running
+            now = time.monotonic()
+            if now - session._last_verified < CONTAINER_VERIFY_TTL_SECONDS:
+                session.last_accessed = now
+                return session
+
+        while True:
+            lock = self._session_locks.get(session_id)
+            if lock is None:
+                lock = self._session_locks[session_id] = asyncio.Lock()
+            async with lock:
+                # The entry may have been dropped while we waited; queue on the current lock
+                if self._session_locks.get(session_id) is not lock:
+                    continue
                 try:
-                    container = await docker_client.containers.get(session.container_name)
-                    info = await container.show()
-                    if info["State"]["Status"] == "running":
-                        return session
-                except aiodocker.exceptions.DockerError:
-                    pass
-                # Container not running, need to recreate
-                session._state = SessionState.DELETING
+                    return await self._get_or_create_locked(session_id)
+                except Exception:
+                    # Nothing was created: don't keep a lock for this ID
+                    if session_id not in self._sessions:
+                        del self._session_locks[session_id]
+                    raise
 
-        # Slow path: need global lock
-        async with self._global_lock:
-            # Double-check pattern
-            session = self._sessions.get(session_id)
-            if session and session._state == SessionState.READY:
-                return session
+    async def _get_or_create_locked(self, session_id: str) -> Session:
+        """Body of get_or_create_session; caller holds the session ID's lock."""
+        session = self._sessions.get(session_id)
+        if session and session._state == SessionState.READY:
+            # Verify container is still running
+            try:
+                if await get_container_status(session.container_name) == "running":
+                    session.last_accessed = session._last_verified = time.monotonic()
+                    return session
+            except aiodocker.exceptions.DockerError:
+                pass
+            # Container not running, need to recreate
+            session._state = SessionState.DELETING
 
+        # Ports in use, read before taking the global lock
+        used_ports = await asyncio.to_thread(self._snapshot_used_ports)
+
+        async with self._global_lock:
             # Clean up old session if exists
-            if session:
-                self._sessions.pop(session_id, None)
+            if session and self._sessions.get(session_id) is session:
+                self._sessions.pop(session_id)
+                self._by_container.pop(session.container_name, None)
                 if session.port:
                     self._release_port(session.port)
 
             # Create new session with port allocation (atomic)
             session = Session(session_id=session_id)
             self._sessions[session_id] = session
-            port = self._allocate_port()
-            session.port = port
+            session.port = await self._allocate_port(used_ports)
 
         # Create container (outside global lock, but session is in CREATING state)
         try:
             await self._create_container(session)
-            async with session._lock:
-                session._state = SessionState.READY
+            session._state = SessionState.READY
             return session
-        except Exception as e:
-            # Cleanup on failure
-            async with self._global_lock:
-                self._sessions.pop(session_id, None)
+        except Exception:
+            # Cleanup on failure (no await, so no lock). A forced delete
+            # may already have removed the session and released its port.
+            if self._sessions.get(session_id) is session:
+                self._sessions.pop(session_id)
+                self._by_container.pop(session.container_name, None)
                 if session.port:
                     self._release_port(session.port)
             raise
 
+    @staticmethod
+    def _prepare_workspace(session_id: str) -> Path:
+        """Create a workspace directory owned by uid 1000 (matches both host user and container vibe user)."""
+        workspace_dir = WORKSPACE_BASE / session_id
+        workspace_dir.mkdir(parents=True, exist_ok=True)
+        os.chmod(workspace_dir, 0o755)
+        os.chown(workspace_dir, 1000, 1000)
+        return workspace_dir
+
     async def _create_container(self, session: Session) -> None:
         """Create a Docker container for the session."""
         container_name = get_container_name(session.session_id)
         session.container_name = container_name
+        self._by_container[container_name] = session.session_id
 
-        # Create workspace directory owned by uid 1000 (matches both host user and container vibe user)
-        workspace_dir = WORKSPACE_BASE / session.session_id
-        workspace_dir.mkdir(parents=True, exist_ok=True)
-        os.chmod(workspace_dir, 0o755)
-        os.chown(workspace_dir, 1000, 1000)
+        # Create workspace directory (one worker-thread hop for all three syscalls)
+        workspace_dir = await asyncio.to_thread(self._prepare_workspace, session.session_id)
         session.workspace = str(workspace_dir)
 
         # Remove existing container if any
@@ -291,6 +509,10 @@ class SessionManager:
         # Create container on default bridge (iptables handles isolation)
         config = {
             "Image": DOCKER_IMAGE,
+            "Labels": {
+                SESSION_ID_LABEL: session.session_id,
+                SESSION_PORT_LABEL: str(session.port),
+            },
             "Env": [
                 "TERM=xterm-256color",
                 f"VIBE_MODE={VIBE_MODE}",
@@ -320,22 +542,21 @@ class SessionManager:
         logger.info(f"Created container {container_name} on port {session.port}")
 
         # Wait for ttyd to start
-        await asyncio.sleep(2)
+        if not await wait_for_ttyd(session.port):
+            logger.warning(f"ttyd in {container_name} not answering on port {session.port} yet")
 
     async def acquire_session_ref(self, session_id: str) -> Session:
         """Acquire reference for WebSocket (atomic ref_count increment)."""
         session = self._sessions.get(session_id)
         if not session:
             raise SessionError("Session not found")
-        async with session._lock:
-            session.acquire_ref()
-            session.last_accessed = datetime.now()
+        session.acquire_ref()
+        session.last_accessed = time.monotonic()
         return session
 
     async def release_session_ref(self, session: Session) -> None:
         """Release reference when WebSocket disconnects."""
-        async with session._lock:
-            session.release_ref()
+        session.release_ref()
 
     async def delete_session(self, session_id: str, force: bool = False) -> bool:
         """
@@ -347,13 +568,17 @@ class SessionManager:
             session = self._sessions.get(session_id)
             if not session:
                 return False
-            async with session._lock:
-                if not force and not session.can_delete():
-                    return False
-                session._state = SessionState.DELETING
-                self._sessions.pop(session_id)
-                if session.port:
-                    self._release_port(session.port)
+            if not force and not session.can_delete():
+                return False
+            session._state = SessionState.DELETING
+            self._sessions.pop(session_id)
+            if self._by_container.get(session.container_name) == session_id:
+                del self._by_container[session.container_name]
+            if session.port:
+                self._release_port(session.port)
+            lock = self._session_locks.get(session_id)
+            if lock is not None and not lock.locked():
+                del self._session_locks[session_id]
 
         # Cleanup outside lock
         await self._cleanup_container(session)
@@ -386,30 +611,22 @@ class SessionManager:
             return session.port
         return None
 
-    async def recover_existing_sessions(self) -> None:
-        """Discover and re-register containers from previous server runs.
+    async def _recover_container(self, container) -> Session | None:
+        """Rebuild a READY session from a container of a previous run.
 
-        Running containers are recovered as READY sessions.
-        Stopped containers are restarted (they persist across reboots).
-        Containers that fail to restart are removed.
+        Returns None (after removing the container if unusable) on failure.
         """
         try:
-            containers = await docker_client.containers.list(
-                all=True, filters={"name": [CONTAINER_PREFIX]}
-            )
-        except Exception as e:
-            logger.error(f"Failed to list existing containers: {e}")
-            return
-
-        for container in containers:
-            try:
-                info = await container.show()
-                name = info["Name"].lstrip("/")
-                status = info["State"]["Status"]
+            info = await container.show()
+            name = info["Name"].lstrip("/")
+            status = info["State"]["Status"]
 
-                # Extract session ID and workspace path from bind mount
-                session_id = None
-                workspace_path = None
+            # Session ID comes from the container's labels; containers created
+            # before labels were added only have it in their bind mount
+            labels = info.get("Config", {}).get("Labels") or {}
+            session_id = labels.get(SESSION_ID_LABEL)
+            workspace_path = str(WORKSPACE_BASE / session_id) if session_id else None
+            if not session_id:
                 binds = info.get("HostConfig", {}).get("Binds", [])
                 for bind in binds:
                     parts = bind.split(":")
@@ -418,66 +635,94 @@ class SessionManager:
                         session_id = Path(parts[0]).name
                         break
 
-                if not session_id:
-                    logger.warning(f"Cannot determine session ID for container {name}, removing")
-                    await container.delete(force=True)
-                    continue
+            if not session_id:
+                logger.warning(f"Cannot determine session ID for container {name}, removing")
+                await container.delete(force=True)
+                return None
 
-                # Restart stopped/exited containers instead of removing them
-                if status != "running":
-                    logger.info(f"Restarting stopped container {name} (status: {status})")
-                    try:
-                        await container.start()
-                        await asyncio.sleep(2)
-                        info = await container.show()
-                        status = info["State"]["Status"]
-                        if status != "running":
-                            logger.warning(f"Container {name} failed to restart (status: {status}), removing")
-                            await container.delete(force=True)
-                            continue
-                        logger.info(f"Container {name} restarted successfully")
-                    except Exception as e:
-                        logger.error(f"Failed to restart container {name}: {e}, removing")
+            # Restart stopped/exited containers instead of removing them
+            if status != "running":
+                logger.info(f"Restarting stopped container {name} (status: {status})")
+                try:
+                    await container.start()
+                    await asyncio.sleep(2)
+                    info = await container.show()
+                    status = info["State"]["Status"]
+                    if status != "running":
+                        logger.warning(f"Container {name} failed to restart (status: {status}), removing")
                         await container.delete(force=True)
-                        continue
+                        return None
+                    logger.info(f"Container {name} restarted successfully")
+                except Exception as e:
+                    logger.error(f"Failed to restart container {name}: {e}, removing")
+                    await container.delete(force=True)
+                    return None
 
-                # Extract port from PortBindings
-                port = None
+            # Port from the label, falling back to PortBindings
+            port = int(labels[SESSION_PORT_LABEL]) if labels.get(SESSION_PORT_LABEL) else None
+            if not port:
                 port_bindings = info.get("HostConfig", {}).get("PortBindings", {})
                 for _key, bindings in port_bindings.items():
                     if bindings:
                         port = int(bindings[0]["HostPort"])
                         break
 
-                if not port:
-                    logger.warning(f"Cannot determine port for container {name}, removing")
-                    await container.delete(force=True)
-                    continue
+            if not port:
+                logger.warning(f"Cannot determine port for container {name}, removing")
+                await container.delete(force=True)
+                return None
 
-                created_str = info.get("Created", "")
-                try:
-                    created_at = datetime.fromisoformat(created_str.replace("Z", "+00:00")).replace(tzinfo=None)
-                except (ValueError, AttributeError):
-                    created_at = datetime.now()
+            created_str = info.get("Created", "")
+            try:
+                created_at = datetime.fromisoformat(created_str.replace("Z", "+00:00")).replace(tzinfo=None)
+            except (ValueError, AttributeError):
+                created_at = datetime.now()
+
+            session = Session(
+                session_id=session_id,
+                container_id=container.id,
+                container_name=name,
+                port=port,
+                workspace=workspace_path,
+                created_at=created_at,
+                last_accessed=time.monotonic(),
+            )
+            session._state = SessionState.READY
+            return session
 
-                session = Session(
-                    session_id=session_id,
-                    container_id=container.id,
-                    container_name=name,
-                    port=port,
-                    workspace=workspace_path,
-                    created_at=created_at,
-                    last_accessed=datetime.now(),
-                )
-                session._state = SessionState.READY
+        except Exception as e:
+            logger.error(f"Failed to recover container: {e}")
+            return None
 
-                self._sessions[session_id] = session
-                self._port_allocations.add(port)
+    async def recover_existing_sessions(self) -> None:
+        """Discover and re-register containers from previous server runs.
 
-                logger.info(f"Recovered session {session_id} (container {name}, port {port})")
+        Running containers are recovered as READY sessions.
+        Stopped containers are restarted (they persist across reboots).
+        Containers that fail to restart are removed.
+        """
+        try:
+            containers = await docker_client.containers.list(
+                all=True, filters={"name": [CONTAINER_PREFIX]}
+            )
+        except Exception as e:
+            logger.error(f"Failed to list existing containers: {e}")
+            return
 
-            except Exception as e:
-                logger.error(f"Failed to recover container: {e}")
+        # Inspect/restart containers concurrently, then register in one pass
+        results = await asyncio.gather(
+            *(self._recover_container(c) for c in containers)
+        )
+        for session in results:
+            if session is None:
+                continue
+            self._sessions[session.session_id] = session
+            self._by_container[session.container_name] = session.session_id
+            self._port_allocations.add(session.port)
+            logger.info(
+                f"Recovered session {session.session_id} "
+                f"(container {session.container_name}, port {session.port})"
+            )
 
         if self._sessions:
             logger.info(f"Recovered {len(self._sessions)} session(s) from previous run")
@@ -486,7 +731,8 @@ class SessionManager:
         """Clean up workspace directories that have no corresponding container.
 
         This handles cases like power cuts where containers are gone but
-        workspace directories remain on disk.
+        workspace directories remain on disk. Stale upload temp files are
+        removed as well.
         """
         if not WORKSPACE_BASE.exists():
             return
@@ -496,6 +742,14 @@ class SessionManager:
 
         # Check each workspace directory
         for workspace_dir in WORKSPACE_BASE.iterdir():
+            if workspace_dir.name.startswith(".upload-") and workspace_dir.is_file():
+                # Temp file left by an upload interrupted by a restart
+                try:
+                    workspace_dir.unlink()
+                    logger.info(f"Removed stale upload temp file {workspace_dir.name}")
+                except OSError as e:
+                    logger.error(f"Failed to remove stale upload temp file {workspace_dir.name}: {e}")
+                continue
             if not workspace_dir.is_dir():
                 continue
 
@@ -521,10 +775,19 @@ class SessionManager:
             else:
                 logger.error(f"Failed to delete orphaned workspace {session_id[:12]}")
 
+    def get_session_by_container(self, container_name: str) -> Session | None:
+        """Get the session a container belongs to, if it is still managed."""
+        session_id = self._by_container.get(container_name)
+        return self._sessions.get(session_id) if session_id else None
+
     def list_sessions(self) -> list[Session]:
         """Get all sessions."""
         return list(self._sessions.values())
 
+    def list_ready_sessions(self) -> list[Session]:
+        """Get sessions whose container is up (not being created or deleted)."""
+        return [s for s in self._sessions.values() if s._state == SessionState.READY]
+
 
 # =============================================================================
 # SESSION OWNERSHIP
@@ -540,6 +803,10 @@ class SessionOwnerStore:
     def __init__(self, path: Path):
         self._path = path
         self._owners: dict[str, str] = {}
+        self._by_user: dict[str, dict[str, None]] = {}  # username -> session IDs (ordered set)
+        self._dirty = False
+        self._save_task: asyncio.Task | None = None
+        self._save_lock = asyncio.Lock()
         self._load()
 
     def _load(self):
@@ -549,23 +816,76 @@ class SessionOwnerStore:
                     self._owners = json.load(f)
             except (json.JSONDecodeError, IOError):
                 self._owners = {}
-
-    def _save(self):
+        for session_id, username in self._owners.items():
+            self._by_user.setdefault(username, {})[session_id] = None
+
+    def _unindex(self, session_id: str, username: str):
+        sessions = self._by_user.get(username)
+        if sessions is not None:
+            sessions.pop(session_id, None)
+            if not sessions:
+                del self._by_user[username]
+
+    def _write(self, owners: dict[str, str]):
+        """Atomically write an owners snapshot to disk (runs in a worker thread)."""
         self._path.parent.mkdir(parents=True, exist_ok=True)
         tmp_path = self._path.with_suffix(".tmp")
         with open(tmp_path, "w") as f:
-            json.dump(self._owners, f, indent=2)
+            json.dump(owners, f, separators=(",", ":"))
         tmp_path.replace(self._path)
 
+    def _save(self):
+        """Schedule a write; changes within OWNER_STORE_SAVE_DELAY_SECONDS are coalesced."""
+        self._dirty = True
+        if self._save_task is not None and not self._save_task.done():
+            return
+        try:
+            self._save_task = asyncio.get_running_loop().create_task(self._save_later())
+        except RuntimeError:
+            # No event loop running: write synchronously
+            self._write(dict(self._owners))
+            self._dirty = False
+
+    async def _save_later(self):
+        await asyncio.sleep(OWNER_STORE_SAVE_DELAY_SECONDS)
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Failed to save session owners: {e}")
+
+    async def flush(self):
+        """Write pending changes to disk now. Changes stay pending if the write fails."""
+        async with self._save_lock:
+            while self._dirty:
+                # Cleared first so changes made during the write trigger another one
+                self._dirty = False
+                try:
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self._write, dict(self._owners)
+                    )
+                except BaseException:
+                    self._dirty = True
+                    raise
+
+    async def close(self):
+        """Wait for a scheduled write, then flush anything still pending."""
+        if self._save_task is not None:
+            await self._save_task
+        await self.flush()
+
     def assign(self, session_id: str, username: str):
         """Record that username owns session_id."""
+        old_owner = self._owners.get(session_id)
+        if old_owner is not None:
+            self._unindex(session_id, old_owner)
         self._owners[session_id] = username
+        self._by_user.setdefault(username, {})[session_id] = None
         self._save()
 
     def remove(self, session_id: str):
         """Remove ownership record."""
         if session_id in self._owners:
-            del self._owners[session_id]
+            self._unindex(session_id, self._owners.pop(session_id))
             self._save()
 
     def get_owner(self, session_id: str) -> str | None:
@@ -574,11 +894,11 @@ class SessionOwnerStore:
 
     def get_user_sessions(self, username: str) -> list[str]:
         """Get all session IDs owned by a user."""
-        return [sid for sid, owner in self._owners.items() if owner == username]
+        return list(self._by_user.get(username, ()))
 
     def count_user_sessions(self, username: str) -> int:
         """Count sessions owned by a user."""
-        return sum(1 for owner in self._owners.values() if owner == username)
+        return len(self._by_user.get(username, ()))
 
     def all_session_ids(self) -> set[str]:
         """Get all tracked session IDs."""
@@ -616,63 +936,230 @@ def verify_session_ownership(request: Request, session_id: str):
         raise HTTPException(status_code=403, detail="Access denied")
 
 
+def get_owned_session(request: Request, session_id: str) -> Session:
+    """Get a session the current user owns. Raises HTTPException if missing or not owned."""
+    verify_session_ownership(request, session_id)
+    session = session_manager.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+
+def resolve_workspace_path(workspace: Path, relative_path: str) -> Path:
+    """Resolve a client-supplied path inside an already-resolved workspace.
+
+    Raises HTTPException(400) for ".." components or anything (e.g. a
+    symlink) that resolves outside the workspace.
+    """
+    clean_path = relative_path.strip("/\\")
+    if ".." in Path(clean_path).parts:
+        raise HTTPException(status_code=400, detail="Invalid path")
+    try:
+        target = (workspace / clean_path).resolve()
+    except (OSError, RuntimeError):
+        raise HTTPException(status_code=400, detail="Invalid path")
+    if not target.is_relative_to(workspace):
+        raise HTTPException(status_code=400, detail="Invalid path")
+    return target
+
+
+async def check_session_container(session: Session, status: str | None) -> float:
+    """Restart or clean up a session whose container died.
+
+    status is the container's State.Status, or None if it no longer exists.
+    Returns the delay in seconds before the session should be checked again.
+    """
+    if session._state != SessionState.READY:
+        return CLEANUP_RECHECK_SECONDS
+    try:
+        if status == "running":
+            return CLEANUP_INTERVAL_SECONDS
+        if status is None:
+            await session_manager.delete_session(session.session_id, force=True)
+            if owner_store:
+                owner_store.remove(session.session_id)
+        elif status in ("exited", "dead"):
+            # Try to restart
+            try:
+                container = await docker_client.containers.get(session.container_name)
+                await container.start()
+                logger.info(f"Restarted dead container for session {session.session_id}")
+            except aiodocker.exceptions.DockerError as e:
+                if e.status != 404:
+                    # A failed start doesn't mean it's gone (Docker may be
+                    # restarting it itself); check again later
+                    logger.warning(f"Could not restart container for session {session.session_id}: {e}")
+                    return CLEANUP_RECHECK_SECONDS
+                # Container is gone - clean up
+                await session_manager.delete_session(session.session_id, force=True)
+                if owner_store:
+                    owner_store.remove(session.session_id)
+                logger.info(f"Cleaned up dead container for session {session.session_id}")
+    except aiodocker.exceptions.DockerError:
+        pass
+    return CLEANUP_RECHECK_SECONDS
+
+
 async def cleanup_old_sessions():
-    """Clean up dead containers and orphaned owner store entries."""
+    """Clean up dead containers and orphaned owner store entries.
+
+    Sessions are checked in order of a heap of next-check times: running
+    containers every CLEANUP_INTERVAL_SECONDS, anything that looked unhealthy
+    (or was just restarted) again after CLEANUP_RECHECK_SECONDS. Containers
+    reported removed by watch_container_events() are checked immediately,
+    ones reported dead after CLEANUP_RECHECK_SECONDS, which gives Docker's
+    restart policy the first chance to bring them back.
+    """
+    check_heap: list[tuple[float, str]] = []  # (next_check_time, session_id)
+    due: dict[str, float] = {}  # session_id -> its live heap entry's time
+    next_orphan_sweep = 0.0
+
     while True:
+        now = time.monotonic()
         try:
+            # Schedule sessions created or recovered since the last pass
+            for session in session_manager.list_ready_sessions():
+                if session.session_id not in due:
+                    due[session.session_id] = now
+                    heapq.heappush(check_heap, (now, session.session_id))
+
             # Clean up containers that have died
-            for session in session_manager.list_sessions():
-                if session._state != SessionState.READY:
-                    continue
+            batch = []
+            while check_heap and check_heap[0][0] <= now:
+                when, sid = heapq.heappop(check_heap)
+                if due.get(sid) != when:
+                    continue  # Superseded by an earlier event-driven check
+                del due[sid]
+                session = session_manager.get_session(sid)
+                if session is not None:
+                    batch.append(session)
+            if batch:
+                # Statuses for everything due at once: from the events cache,
+                # or a single container listing for any cache misses
                 try:
-                    container = await docker_client.containers.get(session.container_name)
-                    info = await container.show()
-                    if info["State"]["Status"] in ("exited", "dead"):
-                        # Try to restart
-                        try:
-                            await container.start()
-                            logger.info(f"Restarted dead container for session {session.session_id}")
-                        except Exception:
-                            # Can't restart - clean up
-                            await session_manager.delete_session(session.session_id, force=True)
-                            if owner_store:
-                                owner_store.remove(session.session_id)
-                            logger.info(f"Cleaned up dead container for session {session.session_id}")
-                except aiodocker.exceptions.DockerError as e:
-                    if is_container_not_found(e):
-                        await session_manager.delete_session(session.session_id, force=True)
-                        if owner_store:
-                            owner_store.remove(session.session_id)
+                    statuses = await get_container_statuses(
+                        [session.container_name for session in batch if session.container_name]
+                    )
+                except aiodocker.exceptions.DockerError:
+                    statuses = None
+                for session in batch:
+                    if statuses is None:
+                        delay = CLEANUP_RECHECK_SECONDS
+                    else:
+                        delay = await check_session_container(
+                            session, statuses.get(session.container_name)
+                        )
+                    if session_manager.get_session(session.session_id) is session:
+                        due[session.session_id] = now + delay
+                        heapq.heappush(check_heap, (now + delay, session.session_id))
 
             # Clean up orphaned owner store entries (owner store has ID but no session)
-            if owner_store:
-                for sid in list(owner_store.all_session_ids()):
-                    if session_manager.get_session(sid) is None:
-                        # Session not in manager - check if container exists
-                        container_name = get_container_name(sid)
-                        try:
-                            await docker_client.containers.get(container_name)
+            if owner_store and now >= next_orphan_sweep:
+                next_orphan_sweep = now + CLEANUP_INTERVAL_SECONDS
+                orphans = [
+                    sid for sid in owner_store.all_session_ids()
+                    if session_manager.get_session(sid) is None
+                ]
+                if orphans:
+                    # One listing answers "does its container exist" for every orphan
+                    containers = await docker_client.containers.list(
+                        all=True, filters={"name": [CONTAINER_PREFIX]}
+                    )
+                    existing = {c["Names"][0].lstrip("/") for c in containers}
+                    for sid in orphans:
+                        if get_container_name(sid) in existing:
                             # Container exists but not in session manager - will be
                             # recovered on next startup. Leave owner entry alone.
-                        except aiodocker.exceptions.DockerError:
-                            # Container truly gone - remove owner entry
-                            owner_store.remove(sid)
-                            logger.info(f"Removed orphaned owner entry for session {sid[:12]}")
+                            continue
+                        # Container truly gone - remove owner entry
+                        owner_store.remove(sid)
+                        logger.info(f"Removed orphaned owner entry for session {sid[:12]}")
 
         except Exception as e:
             logger.error(f"Cleanup error: {e}")
 
-        await asyncio.sleep(CLEANUP_INTERVAL_SECONDS)
+        delay = check_heap[0][0] - time.monotonic() if check_heap else CLEANUP_INTERVAL_SECONDS
+        try:
+            name, exit_delay = await asyncio.wait_for(
+                container_exits.get(), timeout=min(max(delay, 1), CLEANUP_INTERVAL_SECONDS)
+            )
+        except asyncio.TimeoutError:
+            continue
+        session = session_manager.get_session_by_container(name)
+        if session is not None:
+            when = time.monotonic() + exit_delay
+            if when < due.get(session.session_id, float("inf")):
+                due[session.session_id] = when
+                heapq.heappush(check_heap, (when, session.session_id))
+
+
+async def watch_container_events():
+    """Keep container_status in sync with the Docker daemon's event stream.
+
+    The cache is seeded from one container listing; the stream then replays
+    events from just before the listing, so nothing is missed in between.
+    If the stream drops, the cache is cleared (lookups fall back to
+    inspecting containers) and the watcher reconnects.
+    """
+    while True:
+        events_task = None
+        try:
+            since = str(int(time.time()) - 1)
+            containers = await docker_client.containers.list(
+                all=True, filters={"name": [CONTAINER_PREFIX]}
+            )
+            for container in containers:
+                container_status[container["Names"][0].lstrip("/")] = container["State"]
+
+            subscriber = docker_client.events.subscribe(create_task=False)
+            events_task = asyncio.create_task(
+                docker_client.events.run(since=since, filters={"type": ["container"]})
+            )
+
+            while (event := await subscriber.get()) is not None:
+                name = event.get("Actor", {}).get("Attributes", {}).get("name", "")
+                if not name.startswith(CONTAINER_PREFIX):
+                    continue
+                action = event.get("Action", "")
+                if action == "destroy":
+                    container_status.pop(name, None)
+                elif action in _EVENT_STATUS:
+                    container_status[name] = _EVENT_STATUS[action]
+                if action == "die":
+                    # Docker's restart policy may be bringing it back; look later
+                    container_exits.put_nowait((name, CLEANUP_RECHECK_SECONDS))
+                elif action == "destroy":
+                    container_exits.put_nowait((name, 0.0))
+            logger.warning("Docker event stream ended, reconnecting")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Docker event watcher error: {e}")
+        finally:
+            container_status.clear()
+            if events_task is not None:
+                events_task.cancel()
+                try:
+                    await events_task
+                except (asyncio.CancelledError, Exception):
+                    pass
+
+        await asyncio.sleep(5)
 
 
 async def cleanup_expired_auth_sessions():
-    """Periodically clean up expired authentication sessions to prevent memory leaks."""
+    """Periodically clean up expired authentication sessions to prevent memory leaks.
+
+    Also picks up changes to auth.yaml (e.g. from edit_user.py).
+    """
     while True:
         try:
             if auth_manager:
+                auth_manager.reload_config()
                 count = auth_manager.cleanup_expired_sessions()
                 if count > 0:
                     logger.info(f"Cleaned up {count} expired auth session(s)")
+                get_rate_limiter().sweep()
         except Exception as e:
             logger.error(f"Auth session cleanup error: {e}")
 
@@ -688,6 +1175,7 @@ async def lifespan(app: FastAPI):
     WORKSPACE_BASE.mkdir(parents=True, exist_ok=True)
     owner_store = SessionOwnerStore(OWNER_STORE_PATH)
     docker_client = aiodocker.Docker()
+    events_task = asyncio.create_task(watch_container_events())
     await session_manager.recover_existing_sessions()
     await session_manager.cleanup_orphaned_workspaces()
     cleanup_task = asyncio.create_task(cleanup_old_sessions())
@@ -697,8 +1185,13 @@ async def lifespan(app: FastAPI):
     yield
 
     # Shutdown
+    events_task.cancel()
     cleanup_task.cancel()
     auth_cleanup_task.cancel()
+    try:
+        await events_task
+    except asyncio.CancelledError:
+        pass
     try:
         await cleanup_task
     except asyncio.CancelledError:
@@ -707,6 +1200,10 @@ async def lifespan(app: FastAPI):
         await auth_cleanup_task
     except asyncio.CancelledError:
         pass
+    try:
+        await owner_store.close()
+    except Exception as e:
+        logger.error(f"Failed to save session owners: {e}")
     if docker_client is not None:
         await docker_client.close()
     if _http_client is not None:
@@ -746,41 +1243,62 @@ if static_dir.exists():
 auth_manager = create_auth_manager()
 
 # Paths that never require authentication
-_AUTH_EXEMPT = {"/login", "/logout"}
+_AUTH_EXEMPT = frozenset({"/login", "/logout"})
 
 
-@app.middleware("http")
-async def auth_middleware(request: Request, call_next):
-    """Gate every request behind login when authentication is enabled."""
-    if not auth_manager:
-        # No auth — single anonymous user
-        request.state.username = "__anonymous__"
-        return await call_next(request)
+class AuthMiddleware:
+    """Gate every request behind login when authentication is enabled.
 
-    path = request.url.path
+    Plain ASGI middleware: unlike @app.middleware("http") it wraps requests
+    in no extra task or body stream. WebSocket connections pass straight
+    through; websocket_proxy authenticates them itself.
+    """
 
-    # Allow auth-exempt paths and static assets (needed for login page CSS/JS)
-    if path in _AUTH_EXEMPT or path.startswith("/static/"):
-        return await call_next(request)
+    def __init__(self, app):
+        self.app = app
 
-    # Check session cookie
-    token = request.cookies.get("vibe_session")
-    username = auth_manager.validate_session(token) if token else None
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-    if username:
-        request.state.username = username
-        return await call_next(request)
+        # Allow auth-exempt paths and static assets (needed for login page CSS/JS)
+        # before building a Request: these are the bulk of page-load requests
+        path = scope["path"]
+        if path.startswith("/static/") or (auth_manager and path in _AUTH_EXEMPT):
+            await self.app(scope, receive, send)
+            return
 
-    # Not authenticated — reject
-    # WebSocket upgrades get 401 (can't redirect)
-    if "upgrade" in request.headers.get("connection", "").lower():
-        return Response(status_code=401, content="Unauthorized")
+        request = Request(scope)
+        if not auth_manager:
+            # No auth — single anonymous user
+            request.state.username = "__anonymous__"
+            await self.app(scope, receive, send)
+            return
 
-    # Regular HTTP — redirect to login with return URL
-    next_url = request.url.path
-    if request.url.query:
-        next_url += f"?{request.url.query}"
-    return RedirectResponse(f"/login?next={next_url}", status_code=302)
+        # Check session cookie
+        token = request.cookies.get("vibe_session")
+        username = auth_manager.validate_session(token) if token else None
+
+        if username:
+            request.state.username = username
+            await self.app(scope, receive, send)
+            return
+
+        # Not authenticated — reject
+        if "upgrade" in request.headers.get("connection", "").lower():
+            # Upgrade requests get 401 (can't redirect)
+            response = Response(status_code=401, content="Unauthorized")
+        else:
+            # Regular HTTP — redirect to login with return URL
+            next_url = path
+            if request.url.query:
+                next_url += f"?{request.url.query}"
+            response = RedirectResponse(f"/login?next={next_url}", status_code=302)
+        await response(scope, receive, send)
+
+
+app.add_middleware(AuthMiddleware)
 
 
 @app.get("/login", response_class=HTMLResponse)
@@ -814,7 +1332,6 @@ def _is_safe_redirect(url: str) -> bool:
     if not url.startswith("/") or url.startswith("//"):
         return False
     # No scheme or netloc allowed
-    from urllib.parse import urlparse
     parsed = urlparse(url)
     # For relative URLs starting with /, path should equal url and no scheme/netloc
     return not parsed.scheme and not parsed.netloc
@@ -850,7 +1367,8 @@ async def login_submit(request: Request):
             "next_url": next_url,
         }, status_code=429)
 
-    if auth_manager.authenticate(username, password):
+    # bcrypt (and LDAP, when enabled) block for a noticeable time by design
+    if await asyncio.to_thread(auth_manager.authenticate, username, password):
         rate_limiter.clear_on_success(username, client_ip)
         token = auth_manager.create_session(username)
         response = RedirectResponse(next_url, status_code=302)
@@ -861,7 +1379,7 @@ async def login_submit(request: Request):
             secure=True,
             samesite="strict",
             path="/",
-            max_age=int(auth_manager._timeout.total_seconds()),
+            max_age=int(auth_manager._timeout_seconds),
         )
         return response
 
@@ -904,23 +1422,26 @@ async def create_new_session(request: Request):
     """Create a new terminal session for the current user."""
     username = get_current_user(request)
 
+    # Prune gone sessions before counting (owner_store may have stale entries).
+    # Idempotent, so it runs outside the lock and never queues other creates.
+    user_sessions = {
+        sid: session_manager.get_session(sid) for sid in owner_store.get_user_sessions(username)
+    }
+    try:
+        statuses = await get_container_statuses(
+            [session.container_name for session in user_sessions.values() if session and session.container_name]
+        )
+    except aiodocker.exceptions.DockerError:
+        statuses = {}
+    for sid, session in user_sessions.items():
+        if session and not session.container_name:
+            continue  # Container still being created
+        if not session or statuses.get(session.container_name) in (None, "exited", "dead"):
+            owner_store.remove(sid)
+
     if username not in _user_create_locks:
         _user_create_locks[username] = asyncio.Lock()
     async with _user_create_locks[username]:
-        # Prune gone sessions before counting (owner_store may have stale entries)
-        for sid in owner_store.get_user_sessions(username):
-            session = session_manager.get_session(sid)
-            if not session:
-                owner_store.remove(sid)
-                continue
-            try:
-                container = await docker_client.containers.get(session.container_name)
-                info = await container.show()
-                if info["State"]["Status"] in ("exited", "dead"):
-                    owner_store.remove(sid)
-            except aiodocker.exceptions.DockerError:
-                owner_store.remove(sid)
-
         # Enforce max sessions per user
         count = owner_store.count_user_sessions(username)
         if count >= MAX_SESSIONS_PER_USER:
@@ -969,108 +1490,236 @@ async def terminal_page(request: Request, session_id: str):
 @app.get("/session/{session_id}/status")
 async def session_status(request: Request, session_id: str):
     """Get session status."""
-    verify_session_ownership(request, session_id)
-
-    session = session_manager.get_session(session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
+    session = get_owned_session(request, session_id)
 
-    try:
-        container = await docker_client.containers.get(session.container_name)
-        info = await container.show()
+    status = await get_container_status(session.container_name)
+    if status is None:
         return {
             "session_id": session_id,
-            "status": info["State"]["Status"],
-            "created_at": session.created_at.isoformat(),
-            "last_accessed": session.last_accessed.isoformat(),
+            "status": "not_found",
         }
-    except aiodocker.exceptions.DockerError as e:
-        if is_container_not_found(e):
-            return {
-                "session_id": session_id,
-                "status": "not_found",
-            }
-        raise
+    return {
+        "session_id": session_id,
+        "status": status,
+        "created_at": session.created_at.isoformat(),
+        "last_accessed": monotonic_to_datetime(session.last_accessed).isoformat(),
+    }
 
 
 @app.post("/session/{session_id}/upload")
-async def upload_file(
-    request: Request,
-    session_id: str,
-    file: UploadFile = File(...),
-    path: Optional[str] = Form(None)
-):
+async def upload_file(request: Request, session_id: str):
     """Upload a file to the session workspace.
 
-    Args:
-        session_id: The session ID
+    Multipart form fields:
         file: The file to upload
         path: Optional relative path (for folder uploads, preserves structure)
+
+    The body is parsed as it arrives and the file part written straight to
+    disk, rather than spooled by the framework and copied afterwards.
     """
-    verify_session_ownership(request, session_id)
+    session = get_owned_session(request, session_id)
 
-    session = session_manager.get_session(session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
+    workspace = session.resolved_workspace
+
+    upload = UploadReceiver(request.headers.get("content-type", ""))
+    try:
+        # Parse and write in worker-thread hops of about UPLOAD_WRITE_BATCH bytes
+        pending = bytearray()
+        async for chunk in request.stream():
+            pending += chunk
+            if len(pending) >= UPLOAD_WRITE_BATCH:
+                await asyncio.to_thread(upload.write, bytes(pending))
+                pending.clear()
+        await asyncio.to_thread(upload.finish, bytes(pending))
 
-    workspace = Path(session.workspace)
+        if upload.tmp_path is None:
+            raise HTTPException(status_code=400, detail="No file uploaded")
 
-    # Use provided path or fall back to filename
-    relative_path = path or file.filename
+        # Use provided path or fall back to filename
+        relative_path = upload.fields.get("path") or upload.filename
 
-    # Sanitize path - remove any attempts to escape workspace
-    relative_path = relative_path.lstrip("/").lstrip("\\")
-    if ".." in relative_path:
-        raise HTTPException(status_code=400, detail="Invalid path")
+        relative_path = relative_path.lstrip("/").lstrip("\\")
 
-    # Get just the filename for validation
-    filename = Path(relative_path).name
-    if not filename:
-        raise HTTPException(status_code=400, detail="Invalid filename")
+        # Get just the filename for validation
+        filename = Path(relative_path).name
+        if not filename:
+            raise HTTPException(status_code=400, detail="Invalid filename")
 
-    filepath = workspace / relative_path
+        filepath = resolve_workspace_path(workspace, relative_path)
 
-    try:
+        try:
+            # Directory creation, permissions and the rename in one thread hop
+            await asyncio.to_thread(upload.move_into, filepath, workspace)
+
+            return {
+                "filename": filename,
+                "path": relative_path,
+                "size": upload.size,
+                "full_path": f"/home/vibe/workspace/{relative_path}"
+            }
+        except Exception as e:
+            logger.error(f"Upload failed for {relative_path}: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+    except MultipartParseError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed upload: {e}")
+    finally:
+        upload.discard()
+
+
+def make_upload_dirs(directory: Path, workspace: Path) -> None:
+    """Create directory and any missing parents below workspace, owned by uid 1000.
+
+    Only directories created here are chmod/chowned, so uploads into an
+    existing folder cost a single stat rather than a walk up to the root.
+    """
+    missing = []
+    while directory != workspace and not directory.is_dir():
+        missing.append(directory)
+        directory = directory.parent
+    for directory in reversed(missing):
+        directory.mkdir(exist_ok=True)
+        os.chmod(directory, 0o755)
+        os.chown(directory, 1000, 1000)
+
+
+class UploadReceiver:
+    """Streaming parser for the upload form.
+
+    The file part is written to a temp file in WORKSPACE_BASE as it is
+    parsed, so it can usually be renamed into the workspace without a copy
+    (workspaces on another filesystem fall back to copying). Other
+    fields are small and kept in memory. write() and finish() do blocking
+    file I/O; call them from a worker thread.
+    """
+
+    MAX_FIELD_SIZE = 64 * 1024
+
+    def __init__(self, content_type: str):
+        _, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+        self.fields: dict[str, str] = {}
+        self.filename: str | None = None
+        self.tmp_path: Path | None = None
+        self.size = 0
+        self._file = None
+        self._in_file = False
+        self._name = ""
+        self._value = bytearray()
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._disposition = b""
+        self._ended = False
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_end": self._on_end,
+        })
+
+    def write(self, data: bytes) -> None:
+        self._parser.write(data)
+
+    def finish(self, data: bytes = b"") -> None:
+        if data:
+            self._parser.write(data)
+        self._parser.finalize()
+        # finalize() does not check that the closing boundary was seen
+        if not self._ended:
+            raise MultipartParseError("Incomplete multipart body")
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def move_into(self, filepath: Path, workspace: Path) -> None:
+        """Move the received file to filepath, creating parent directories below workspace."""
         # Create parent directories if needed (for folder uploads)
-        filepath.parent.mkdir(parents=True, exist_ok=True)
-        # Set proper permissions on parent directories
-        for parent in filepath.parents:
-            if parent.is_relative_to(workspace):
-                os.chmod(parent, 0o755)
-                os.chown(parent, 1000, 1000)
-
-        # Stream file to disk in chunks for large files
-        async with aiofiles.open(filepath, "wb") as f:
-            total_size = 0
-            while chunk := await file.read(1024 * 1024):  # 1MB chunks
-                await f.write(chunk)
-                total_size += len(chunk)
-
-        # Set proper permissions (644 for files)
-        os.chmod(filepath, 0o644)
-        os.chown(filepath, 1000, 1000)
+        make_upload_dirs(filepath.parent, workspace)
 
-        return {
-            "filename": filename,
-            "path": relative_path,
-            "size": total_size,
-            "full_path": f"/home/vibe/workspace/{relative_path}"
-        }
-    except Exception as e:
-        logger.error(f"Upload failed for {file.filename}: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        # Set proper permissions (644 for files), then move into place
+        os.chmod(self.tmp_path, 0o644)
+        os.chown(self.tmp_path, 1000, 1000)
+        try:
+            os.replace(self.tmp_path, filepath)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # Workspace on another filesystem (bind path of a legacy container)
+            shutil.copyfile(self.tmp_path, filepath)
+            os.chmod(filepath, 0o644)
+            os.chown(filepath, 1000, 1000)
+            self.tmp_path.unlink()
+        self.tmp_path = None
+
+    def discard(self) -> None:
+        """Close and delete the temp file unless it was moved into place."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.tmp_path is not None:
+            self.tmp_path.unlink(missing_ok=True)
+            self.tmp_path = None
+
+    def _on_part_begin(self) -> None:
+        self._disposition = b""
+        self._value.clear()
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        if self._header_field.lower() == b"content-disposition":
+            self._disposition = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _on_headers_finished(self) -> None:
+        _, params = parse_options_header(self._disposition)
+        self._name = params.get(b"name", b"").decode("utf-8", "replace")
+        filename = params.get(b"filename")
+        # Only the first "file" part is kept
+        self._in_file = self._name == "file" and filename is not None and self.tmp_path is None
+        if self._in_file:
+            self.filename = filename.decode("utf-8", "replace")
+            fd, tmp = tempfile.mkstemp(dir=WORKSPACE_BASE, prefix=".upload-")
+            self.tmp_path = Path(tmp)
+            self._file = os.fdopen(fd, "wb")
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._in_file:
+            self._file.write(data[start:end])
+            self.size += end - start
+        else:
+            self._value += data[start:end]
+            if len(self._value) > self.MAX_FIELD_SIZE:
+                raise HTTPException(status_code=400, detail=f"Form field {self._name!r} too large")
+
+    def _on_part_end(self) -> None:
+        if self._in_file:
+            self._file.close()
+            self._file = None
+            self._in_file = False
+        elif self._name:
+            self.fields[self._name] = self._value.decode("utf-8", "replace")
+
+    def _on_end(self) -> None:
+        self._ended = True
 
 
 @app.get("/session/{session_id}/files")
 async def list_files(request: Request, session_id: str):
     """List files in the session workspace."""
-    verify_session_ownership(request, session_id)
-
-    session = session_manager.get_session(session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
+    session = get_owned_session(request, session_id)
 
-    workspace = Path(session.workspace)
+    workspace = session.resolved_workspace
 
     files = []
     for item in workspace.iterdir():
@@ -1082,31 +1731,16 @@ async def list_files(request: Request, session_id: str):
             "modified": datetime.fromtimestamp(stat.st_mtime).isoformat(),
         })
 
-    return {"files": files}
+    return JSONResponse({"files": files})
 
 
 @app.get("/session/{session_id}/browse")
 async def browse_files(request: Request, session_id: str, path: str = ""):
     """Browse files in the session workspace with subdirectory support."""
-    verify_session_ownership(request, session_id)
-
-    session = session_manager.get_session(session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-
-    workspace = Path(session.workspace)
+    session = get_owned_session(request, session_id)
 
-    # Sanitize and resolve the path
-    clean_path = path.strip("/").replace("..", "")
-    target_dir = workspace / clean_path if clean_path else workspace
-
-    # Security: ensure path is within workspace
-    try:
-        target_dir = target_dir.resolve()
-        if not str(target_dir).startswith(str(workspace.resolve())):
-            raise HTTPException(status_code=400, detail="Invalid path")
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid path")
+    clean_path = path.strip("/")
+    target_dir = resolve_workspace_path(session.resolved_workspace, clean_path)
 
     if not target_dir.exists():
         raise HTTPException(status_code=404, detail="Path not found")
@@ -1114,65 +1748,121 @@ async def browse_files(request: Request, session_id: str, path: str = ""):
     if not target_dir.is_dir():
         raise HTTPException(status_code=400, detail="Path is not a directory")
 
-    files = []
     try:
-        for item in sorted(target_dir.iterdir(), key=lambda x: (not x.is_dir(), x.name.lower())):
-            try:
-                stat = item.stat()
-                files.append({
-                    "name": item.name,
-                    "size": stat.st_size if not item.is_dir() else get_dir_size(item),
-                    "is_dir": item.is_dir(),
-                    "modified": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                })
-            except (PermissionError, OSError):
-                continue
+        # Subdirectory sizes walk whole trees; keep that off the event loop
+        files = await asyncio.to_thread(list_directory, target_dir)
     except PermissionError:
         raise HTTPException(status_code=403, detail="Permission denied")
 
-    return {
+    # Already plain JSON types: a JSONResponse skips FastAPI's jsonable_encoder
+    # pass, which costs ~10x the serialization itself on large directories
+    return JSONResponse({
         "path": clean_path,
         "files": files,
         "parent": str(Path(clean_path).parent) if clean_path else None
-    }
+    })
+
+
+def list_directory(target_dir: Path) -> list[dict]:
+    """List a directory for the file browser, directories first (blocking)."""
+    # One pass over scandir entries: is_dir() comes from readdir's d_type
+    # and is computed once per entry, not once per sort comparison
+    entries = []
+    with os.scandir(target_dir) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            entries.append((not is_dir, entry.name.lower(), entry.name, entry))
+    entries.sort(key=lambda e: e[:3])
+
+    files = []
+    for not_dir, _, name, entry in entries:
+        try:
+            stat = entry.stat()
+            files.append({
+                "name": name,
+                "size": stat.st_size if not_dir else get_dir_size(Path(entry.path)),
+                "is_dir": not not_dir,
+                "modified": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+            })
+        except (PermissionError, OSError):
+            continue
+    return files
 
 
 def get_dir_size(path: Path) -> int:
-    """Calculate total size of a directory."""
-    total = 0
+    """Calculate total size of a directory, reusing a recent result if possible.
+
+    A cached size is reused while the directory's mtime is unchanged (no
+    entries added, removed or renamed) and it is under
+    DIR_SIZE_CACHE_SECONDS old; edits deeper down or inside files don't
+    touch the mtime, so they show up once the entry expires.
+    """
+    key = str(path)
     try:
-        for item in path.rglob("*"):
-            if item.is_file():
+        mtime = os.stat(key).st_mtime_ns
+    except OSError:
+        return 0
+    now = time.monotonic()
+    with _dir_size_lock:
+        cached = _dir_size_cache.get(key)
+        if cached and cached[0] == mtime and now - cached[1] < DIR_SIZE_CACHE_SECONDS:
+            _dir_size_cache.move_to_end(key)
+            return cached[2]
+    size = _walk_dir_size(path)
+    with _dir_size_lock:
+        _dir_size_cache[key] = (mtime, now, size)
+        _dir_size_cache.move_to_end(key)
+        if len(_dir_size_cache) > DIR_SIZE_CACHE_ENTRIES:
+            _dir_size_cache.popitem(last=False)
+    return size
+
+
+def _walk_dir_size(path: Path) -> int:
+    """Calculate total size of a directory (symlinks are not followed)."""
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
                 try:
-                    total += item.stat().st_size
-                except (PermissionError, OSError):
+                    # DirEntry type checks reuse readdir's d_type; no extra stat
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+                except OSError:
                     pass
-    except (PermissionError, OSError):
-        pass
     return total
 
 
+class WorkspaceFileResponse(FileResponse):
+    """FileResponse that reads in DOWNLOAD_CHUNK_SIZE pieces.
+
+    Each read is a worker-thread hop; Starlette's 64KB default means 16x as
+    many for large files. Servers offering the http.response.pathsend
+    extension still get the path and can sendfile() it themselves.
+    """
+
+    chunk_size = DOWNLOAD_CHUNK_SIZE
+
+
 @app.get("/session/{session_id}/download")
 async def download_file(request: Request, session_id: str, path: str):
     """Download a single file from the session workspace."""
-    verify_session_ownership(request, session_id)
-
-    session = session_manager.get_session(session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
+    session = get_owned_session(request, session_id)
 
-    workspace = Path(session.workspace)
-
-    # Sanitize and resolve the path
-    clean_path = path.strip("/").replace("..", "")
+    clean_path = path.strip("/")
     if not clean_path:
         raise HTTPException(status_code=400, detail="Path required")
 
-    target_file = (workspace / clean_path).resolve()
-
-    # Security: ensure path is within workspace
-    if not str(target_file).startswith(str(workspace.resolve())):
-        raise HTTPException(status_code=400, detail="Invalid path")
+    target_file = resolve_workspace_path(session.resolved_workspace, clean_path)
 
     if not target_file.exists():
         raise HTTPException(status_code=404, detail="File not found")
@@ -1180,7 +1870,7 @@ async def download_file(request: Request, session_id: str, path: str):
     if target_file.is_dir():
         raise HTTPException(status_code=400, detail="Use download-archive for directories")
 
-    return FileResponse(
+    return WorkspaceFileResponse(
         path=target_file,
         filename=target_file.name,
         media_type="application/octet-stream"
@@ -1190,23 +1880,10 @@ async def download_file(request: Request, session_id: str, path: str):
 @app.get("/session/{session_id}/download-archive")
 async def download_archive(request: Request, session_id: str, path: str = ""):
     """Download a directory as a 7z archive (preserves Unix file permissions)."""
-    import py7zr
+    session = get_owned_session(request, session_id)
 
-    verify_session_ownership(request, session_id)
-
-    session = session_manager.get_session(session_id)
-    if not session:
-        raise HTTPException(status_code=404, detail="Session not found")
-
-    workspace = Path(session.workspace)
-
-    # Sanitize and resolve the path
-    clean_path = path.strip("/").replace("..", "")
-    target_dir = (workspace / clean_path).resolve() if clean_path else workspace.resolve()
-
-    # Security: ensure path is within workspace
-    if not str(target_dir).startswith(str(workspace.resolve())):
-        raise HTTPException(status_code=400, detail="Invalid path")
+    clean_path = path.strip("/")
+    target_dir = resolve_workspace_path(session.resolved_workspace, clean_path)
 
     if not target_dir.exists():
         raise HTTPException(status_code=404, detail="Path not found")
@@ -1214,28 +1891,62 @@ async def download_archive(request: Request, session_id: str, path: str = ""):
     if not target_dir.is_dir():
         raise HTTPException(status_code=400, detail="Path is not a directory")
 
-    # Create 7z archive in memory
-    archive_buffer = io.BytesIO()
     archive_name = target_dir.name if clean_path else f"workspace-{session_id[:8]}"
 
-    with py7zr.SevenZipFile(archive_buffer, "w") as szf:
-        for file_path in target_dir.rglob("*"):
-            if file_path.is_file():
-                try:
-                    arcname = str(file_path.relative_to(target_dir))
-                    szf.write(file_path, arcname)
-                except (PermissionError, OSError) as e:
-                    logger.warning(f"Skipping file {file_path}: {e}")
+    # 7z rewrites its start header on close, so the archive can't be piped
+    # out while it is compressed. Build it in an unlinked temp file on the
+    # workspace disk instead of in memory; it is freed when closed, even if
+    # the client disconnects.
+    fd, tmp_path = tempfile.mkstemp(dir=WORKSPACE_BASE, prefix=".archive-")
+    archive = os.fdopen(fd, "w+b")
+    os.unlink(tmp_path)
+    try:
+        await asyncio.to_thread(write_archive, target_dir, archive)
+    except BaseException:
+        archive.close()
+        raise
+    size = archive.seek(0, os.SEEK_END)
+    archive.seek(0)
 
-    archive_buffer.seek(0)
+    async def stream_archive():
+        try:
+            while chunk := await asyncio.to_thread(archive.read, DOWNLOAD_CHUNK_SIZE):
+                yield chunk
+        finally:
+            archive.close()
 
     return StreamingResponse(
-        archive_buffer,
+        stream_archive(),
         media_type="application/x-7z-compressed",
-        headers={"Content-Disposition": f'attachment; filename="{archive_name}.7z"'}
+        headers={
+            "Content-Disposition": f'attachment; filename="{archive_name}.7z"',
+            "Content-Length": str(size),
+        }
     )
 
 
+def write_archive(target_dir: Path, dest) -> None:
+    """Write every file under target_dir into a 7z archive (blocking)."""
+    filters = [{"id": py7zr.FILTER_LZMA2, "preset": ARCHIVE_LZMA_PRESET}]
+    prefix_len = len(str(target_dir)) + 1
+    stack = [str(target_dir)]
+    with py7zr.SevenZipFile(dest, "w", filters=filters) as szf:
+        while stack:
+            try:
+                entries = os.scandir(stack.pop())
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            szf.write(entry.path, entry.path[prefix_len:])
+                    except (PermissionError, OSError) as e:
+                        logger.warning(f"Skipping file {entry.path}: {e}")
+
+
 @app.delete("/session/{session_id}")
 async def delete_session(request: Request, session_id: str):
     """Delete a session and its container. Only the owner can delete.
@@ -1274,7 +1985,15 @@ async def my_sessions(request: Request):
     result = []
     prune_ids = []
 
-    for sid in session_ids:
+    sessions = {sid: session_manager.get_session(sid) for sid in session_ids}
+    try:
+        statuses = await get_container_statuses(
+            [session.container_name for session in sessions.values() if session and session.container_name]
+        )
+    except aiodocker.exceptions.DockerError:
+        statuses = {}
+
+    for sid, session in sessions.items():
         info = {
             "id": sid,
             "label": sid[:8],
@@ -1282,15 +2001,11 @@ async def my_sessions(request: Request):
             "created_at": None,
         }
 
-        session = session_manager.get_session(sid)
         if session:
-            try:
-                container = await docker_client.containers.get(session.container_name)
-                container_info = await container.show()
-                info["status"] = container_info["State"]["Status"]
+            status = statuses.get(session.container_name)
+            if status is not None:
+                info["status"] = status
                 info["created_at"] = session.created_at.isoformat()
-            except aiodocker.exceptions.DockerError:
-                info["status"] = "gone"
 
         if info["status"] == "gone":
             prune_ids.append(sid)
@@ -1340,27 +2055,30 @@ async def list_sessions(request: Request):
         if not is_admin:
             raise HTTPException(status_code=403, detail="Admin access required")
 
+    sessions = session_manager.list_sessions()
+    try:
+        statuses = await get_container_statuses(
+            [session.container_name for session in sessions if session.container_name]
+        )
+    except aiodocker.exceptions.DockerError:
+        statuses = None
+
     result = []
-    for session in session_manager.list_sessions():
-        try:
-            container = await docker_client.containers.get(session.container_name)
-            info = await container.show()
-            status = info["State"]["Status"]
-        except aiodocker.exceptions.DockerError as e:
-            if is_container_not_found(e):
-                status = "not_found"
-            else:
-                status = "error"
+    for session in sessions:
+        if statuses is None:
+            status = "error"
+        else:
+            status = statuses.get(session.container_name, "not_found")
 
         result.append({
             "status": status,
             "created_at": session.created_at.isoformat(),
-            "last_accessed": session.last_accessed.isoformat(),
+            "last_accessed": monotonic_to_datetime(session.last_accessed).isoformat(),
             "ref_count": session._ref_count,
             "state": session._state.name,
         })
 
-    return {"count": len(result), "sessions": result}
+    return JSONResponse({"count": len(result), "sessions": result})
 
 
 # =============================================================================
@@ -1374,7 +2092,16 @@ async def get_http_client() -> httpx.AsyncClient:
     """Get or create the shared HTTP client."""
     global _http_client
     if _http_client is None or _http_client.is_closed:
-        _http_client = httpx.AsyncClient(timeout=30.0)
+        _http_client = httpx.AsyncClient(
+            timeout=30.0,
+            # Proxied requests fan out over one ttyd port per session; keep
+            # enough idle connections around for all of them to be reused
+            limits=httpx.Limits(
+                max_connections=1024,
+                max_keepalive_connections=256,
+                keepalive_expiry=30.0,
+            ),
+        )
     return _http_client
 
 
@@ -1383,6 +2110,31 @@ def get_session_port(session_id: str) -> Optional[int]:
     return session_manager.get_session_port(session_id)
 
 
+# ttyd prefixes every server->client message with a one-byte command.
+# OUTPUT payloads are raw terminal bytes, so consecutive ones can be merged.
+TTYD_OUTPUT = b"0"
+
+
+def is_ttyd_output(message) -> bool:
+    """Check if a ttyd message is a terminal OUTPUT frame."""
+    return isinstance(message, bytes) and message[:1] == TTYD_OUTPUT
+
+
+async def recv_buffered(ws):
+    """Return the next message already buffered on ws, or None without waiting.
+
+    Relies on asyncio.timeout (Python 3.11+); older interpreters never batch.
+    recv() is cancellation-safe, so a timed-out call loses no data.
+    """
+    if not hasattr(asyncio, "timeout"):
+        return None
+    try:
+        async with asyncio.timeout(0):
+            return await ws.recv()
+    except TimeoutError:
+        return None
+
+
 @app.websocket("/ttyd/{session_id}/ws")
 async def websocket_proxy(websocket: WebSocket, session_id: str):
     """
@@ -1423,7 +2175,6 @@ async def websocket_proxy(websocket: WebSocket, session_id: str):
         # Connect to ttyd's WebSocket
         ttyd_ws = None
         try:
-            import websockets
             ttyd_url = f"ws://127.0.0.1:{port}/ws"
 
             async with websockets.connect(
@@ -1438,8 +2189,6 @@ async def websocket_proxy(websocket: WebSocket, session_id: str):
                     """Forward messages from browser to ttyd."""
                     try:
                         while True:
-                            if websocket.client_state != WebSocketState.CONNECTED:
-                                break
                             data = await websocket.receive()
                             if data["type"] == "websocket.receive":
                                 if "bytes" in data:
@@ -1454,24 +2203,61 @@ async def websocket_proxy(websocket: WebSocket, session_id: str):
                         logger.debug(f"Forward to ttyd ended: {e}")
 
                 async def forward_to_browser():
-                    """Forward messages from ttyd to browser."""
+                    """Forward messages from ttyd to browser.
+
+                    OUTPUT frames that are already queued behind the current one
+                    are merged into a single browser frame whose payload stays
+                    within WS_BATCH_MAX_BYTES (a single larger frame is sent
+                    as-is).
+                    """
                     try:
-                        async for message in ttyd_ws:
-                            if websocket.client_state != WebSocketState.CONNECTED:
-                                break
+                        held = None
+                        while True:
+                            message = held if held is not None else await ttyd_ws.recv()
+                            held = None
+                            closed = None
+                            if is_ttyd_output(message):
+                                parts = [message]
+                                size = len(message) - 1
+                                while size < WS_BATCH_MAX_BYTES:
+                                    try:
+                                        queued = await recv_buffered(ttyd_ws)
+                                    except websockets.exceptions.ConnectionClosed as e:
+                                        # Deliver what was drained before ttyd closed
+                                        closed = e
+                                        break
+                                    if queued is None:
+                                        break
+                                    if (not is_ttyd_output(queued)
+                                            or size + len(queued) - 1 > WS_BATCH_MAX_BYTES):
+                                        # Carry over to the next browser frame
+                                        held = queued
+                                        break
+                                    parts.append(memoryview(queued)[1:])
+                                    size += len(queued) - 1
+                                if len(parts) > 1:
+                                    message = b"".join(parts)
                             if isinstance(message, bytes):
                                 await websocket.send_bytes(message)
                             else:
                                 await websocket.send_text(message)
+                            if closed is not None:
+                                raise closed
                     except Exception as e:
                         logger.debug(f"Forward to browser ended: {e}")
 
-                # Run both directions concurrently
-                await asyncio.gather(
-                    forward_to_ttyd(),
-                    forward_to_browser(),
-                    return_exceptions=True
-                )
+                # Run both directions concurrently; when either side goes
+                # away, stop the other instead of waiting for it to notice
+                tasks = [
+                    asyncio.create_task(forward_to_ttyd()),
+                    asyncio.create_task(forward_to_browser()),
+                ]
+                try:
+                    await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
 
         except websockets.exceptions.ConnectionClosed as e:
             logger.info(f"ttyd WebSocket closed for session {session_id[:12]}: {e}")
@@ -1494,6 +2280,14 @@ async def websocket_proxy(websocket: WebSocket, session_id: str):
         await session_manager.release_session_ref(session)
 
 
+# Hop-by-hop headers not forwarded by http_proxy (request side: lowercase raw names)
+_PROXY_REQUEST_HOP_HEADERS = frozenset({
+    b"host", b"connection", b"keep-alive", b"transfer-encoding", b"upgrade",
+    b"proxy-connection", b"proxy-authenticate", b"proxy-authorization", b"te", b"trailers",
+})
+_PROXY_RESPONSE_HOP_HEADERS = frozenset({"transfer-encoding", "connection", "keep-alive"})
+
+
 @app.get("/ttyd/{session_id}/{path:path}")
 @app.get("/ttyd/{session_id}")
 async def http_proxy(request: Request, session_id: str, path: str = ""):
@@ -1516,29 +2310,21 @@ async def http_proxy(request: Request, session_id: str, path: str = ""):
     try:
         client = await get_http_client()
 
-        # Forward the request with appropriate headers
-        headers = {}
-        for key, value in request.headers.items():
-            # Skip hop-by-hop headers
-            if key.lower() not in ('host', 'connection', 'keep-alive', 'transfer-encoding',
-                                   'upgrade', 'proxy-connection', 'proxy-authenticate',
-                                   'proxy-authorization', 'te', 'trailers'):
-                headers[key] = value
-
-        response = await client.get(target_url, headers=headers)
-
-        # Build response headers
-        response_headers = {}
-        for key, value in response.headers.items():
-            if key.lower() not in ('content-encoding', 'content-length', 'transfer-encoding',
-                                   'connection'):
-                response_headers[key] = value
-
-        return Response(
-            content=response.content,
-            status_code=response.status_code,
+        # Forward the request with appropriate headers (raw, so no re-encoding)
+        headers = [(k, v) for k, v in request.headers.raw if k not in _PROXY_REQUEST_HOP_HEADERS]
+        upstream = await client.send(client.build_request("GET", target_url, headers=headers), stream=True)
+
+        # Relay the body as it arrives, still encoded, so Content-Encoding and
+        # Content-Length from ttyd stay valid
+        # httpx yields header names already lowercased
+        response_headers = {
+            k: v for k, v in upstream.headers.items() if k not in _PROXY_RESPONSE_HOP_HEADERS
+        }
+        return StreamingResponse(
+            upstream.aiter_raw(),
+            status_code=upstream.status_code,
             headers=response_headers,
-            media_type=response.headers.get('content-type')
+            background=BackgroundTask(upstream.aclose),
         )
 
     except httpx.ConnectError:
@@ -11,11 +11,14 @@ When auth.yaml does not exist, authentication is disabled entirely
 and the server operates in localhost-only mode (original behaviour).
 """
 
+import hashlib
+import hmac
 import logging
 import os
 import secrets
-from collections import defaultdict
-from datetime import datetime, timedelta
+import time
+from collections import deque
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional
 
@@ -27,6 +30,16 @@ logger = logging.getLogger(__name__)
 # Path to the auth config file (project root)
 AUTH_CONFIG_PATH = Path(__file__).parent.parent / "auth.yaml"
 
+# libyaml-backed loader when PyYAML was built with it
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+DEFAULT_BCRYPT_COST = 12
+BCRYPT_MAX_PASSWORD_BYTES = 72  # Longest password bcrypt can check; bcrypt>=5 raises beyond it
+
+# Longer login input is rejected before any hashing or rate-limit bookkeeping
+MAX_USERNAME_LENGTH = 128
+MAX_PASSWORD_LENGTH = 256
+
 # Rate limiting configuration
 RATE_LIMIT_MAX_ATTEMPTS = 50  # Max failed attempts before lockout
 RATE_LIMIT_WINDOW_MINUTES = 15  # Lockout window in minutes
@@ -43,63 +56,75 @@ class RateLimiter:
     def __init__(self, max_attempts: int = RATE_LIMIT_MAX_ATTEMPTS,
                  window_minutes: int = RATE_LIMIT_WINDOW_MINUTES):
         self._max_attempts = max_attempts
-        self._window = timedelta(minutes=window_minutes)
-        # Key -> list of attempt timestamps
-        self._attempts: dict[str, list[datetime]] = defaultdict(list)
-
-    def _cleanup_old_attempts(self, key: str) -> None:
-        """Remove attempts older than the rate limit window."""
-        cutoff = datetime.now() - self._window
-        self._attempts[key] = [t for t in self._attempts[key] if t > cutoff]
+        self._window_seconds = window_minutes * 60
+        # Key -> time.monotonic() of each attempt, oldest first. Keys whose
+        # attempts have all expired are dropped, so lookups use .get().
+        self._attempts: dict[str, deque[float]] = {}
+
+    @staticmethod
+    def _user_key(username: str) -> str:
+        """Rate-limit key for a username (capped, so huge inputs stay small)."""
+        return f"user:{username[:MAX_USERNAME_LENGTH].lower()}"
+
+    def _cleanup_old_attempts(self, key: str) -> int:
+        """Remove attempts older than the rate limit window. Returns the count left."""
+        attempts = self._attempts.get(key)
+        if attempts is None:
+            return 0
+        cutoff = time.monotonic() - self._window_seconds
+        while attempts and attempts[0] <= cutoff:
+            attempts.popleft()
+        if not attempts:
+            del self._attempts[key]
+        return len(attempts)
+
+    def sweep(self) -> int:
+        """Drop every key whose attempts have all expired. Returns count removed."""
+        before = len(self._attempts)
+        for key in list(self._attempts):
+            self._cleanup_old_attempts(key)
+        return before - len(self._attempts)
 
     def is_blocked(self, username: str, ip_address: str) -> bool:
         """Check if username or IP is currently blocked."""
-        now = datetime.now()
-        cutoff = now - self._window
-
         # Check username
-        user_key = f"user:{username.lower()}"
-        self._cleanup_old_attempts(user_key)
-        if len(self._attempts[user_key]) >= self._max_attempts:
+        user_key = self._user_key(username)
+        if self._cleanup_old_attempts(user_key) >= self._max_attempts:
             return True
 
         # Check IP
         ip_key = f"ip:{ip_address}"
-        self._cleanup_old_attempts(ip_key)
-        if len(self._attempts[ip_key]) >= self._max_attempts:
+        if self._cleanup_old_attempts(ip_key) >= self._max_attempts:
             return True
 
         return False
 
     def record_failure(self, username: str, ip_address: str) -> None:
         """Record a failed login attempt."""
-        now = datetime.now()
-        user_key = f"user:{username.lower()}"
+        now = time.monotonic()
+        user_key = self._user_key(username)
         ip_key = f"ip:{ip_address}"
 
         self._cleanup_old_attempts(user_key)
         self._cleanup_old_attempts(ip_key)
 
-        self._attempts[user_key].append(now)
-        self._attempts[ip_key].append(now)
+        self._attempts.setdefault(user_key, deque()).append(now)
+        self._attempts.setdefault(ip_key, deque()).append(now)
 
     def clear_on_success(self, username: str, ip_address: str) -> None:
         """Clear failed attempts after successful login."""
-        user_key = f"user:{username.lower()}"
+        user_key = self._user_key(username)
         ip_key = f"ip:{ip_address}"
         self._attempts.pop(user_key, None)
         self._attempts.pop(ip_key, None)
 
     def get_remaining_attempts(self, username: str, ip_address: str) -> int:
         """Get remaining attempts before lockout."""
-        user_key = f"user:{username.lower()}"
+        user_key = self._user_key(username)
         ip_key = f"ip:{ip_address}"
 
-        self._cleanup_old_attempts(user_key)
-        self._cleanup_old_attempts(ip_key)
-
-        user_attempts = len(self._attempts[user_key])
-        ip_attempts = len(self._attempts[ip_key])
+        user_attempts = self._cleanup_old_attempts(user_key)
+        ip_attempts = self._cleanup_old_attempts(ip_key)
 
         return max(0, self._max_attempts - max(user_attempts, ip_attempts))
 
@@ -108,19 +133,19 @@ class RateLimiter:
         if not self.is_blocked(username, ip_address):
             return 0
 
-        user_key = f"user:{username.lower()}"
+        user_key = self._user_key(username)
         ip_key = f"ip:{ip_address}"
 
         oldest_relevant = None
         for key in [user_key, ip_key]:
             if self._attempts.get(key):
-                first = min(self._attempts[key])
+                first = self._attempts[key][0]
                 if oldest_relevant is None or first < oldest_relevant:
                     oldest_relevant = first
 
-        if oldest_relevant:
-            unlock_time = oldest_relevant + self._window
-            remaining = (unlock_time - datetime.now()).total_seconds()
+        if oldest_relevant is not None:
+            unlock_time = oldest_relevant + self._window_seconds
+            remaining = unlock_time - time.monotonic()
             return max(0, int(remaining))
 
         return 0
@@ -138,6 +163,13 @@ def get_rate_limiter() -> RateLimiter:
     return _rate_limiter
 
 
+@dataclass(slots=True)
+class LoginSession:
+    """A logged-in user's server-side session."""
+    username: str
+    created_at: float  # time.monotonic()
+
+
 class AuthManager:
     """
     Manages authentication and login sessions.
@@ -151,16 +183,20 @@ class AuthManager:
         6. destroy_session() removes the token on logout
 
     Session tokens are random 256-bit values. Session state is held
-    in server memory (dict). Restarting the server logs everyone out.
+    in server memory (dict), keyed by an HMAC of the token so the raw
+    tokens are never stored. Restarting the server logs everyone out.
     """
 
     def __init__(self, config_path: Path = AUTH_CONFIG_PATH):
         self._config_path = config_path
+        self._config_mtime_ns: int | None = None
         self._config = self._load_config()
-        self._sessions: dict[str, dict] = {}  # token -> {username, created_at}
-        self._timeout = timedelta(
-            hours=self._config.get("session_timeout_hours", 24)
-        )
+        self._sessions: dict[bytes, LoginSession] = {}  # _token_key(token) -> session
+        self._token_secret = secrets.token_bytes(32)
+        self._ldap_server = None  # (settings, ldap3.Server), reused across logins
+        self._timeout_seconds = self._config.get("session_timeout_hours", 24) * 3600.0
+        self._dummy_hash = self._make_dummy_hash()
+        self._local_users = self._index_local_users()
         logger.info("Authentication enabled — %d local user(s) configured",
                      len(self._config.get("users", {})))
         ldap_cfg = self._config.get("ldap", {})
@@ -175,27 +211,45 @@ class AuthManager:
     def _load_config(self) -> dict:
         """Load and validate auth.yaml, with environment variable overrides."""
         with open(self._config_path) as f:
-            config = yaml.safe_load(f)
+            mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            config = yaml.load(f, Loader=_YAML_LOADER)
         if not isinstance(config, dict):
             raise ValueError(f"auth.yaml must be a YAML mapping, got {type(config)}")
 
+        cost = config.get("bcrypt_cost", DEFAULT_BCRYPT_COST)
+        if not isinstance(cost, int) or not 4 <= cost <= 15:
+            raise ValueError(f"bcrypt_cost must be an integer from 4 to 15, got {cost!r}")
+
         # Environment variable override for LDAP bind_password
         ldap_cfg = config.get("ldap", {})
         if ldap_cfg.get("enabled"):
+            # Catch filter templates that could never match a user at load time
+            if "{username}" not in ldap_cfg.get("search_filter", "(uid={username})"):
+                raise ValueError("ldap.search_filter must contain {username}")
+            if ldap_cfg.get("required_group_dn") and "{user_dn}" not in ldap_cfg.get(
+                "group_search_filter", "(&(objectClass=groupOfNames)(member={user_dn}))"
+            ):
+                raise ValueError("ldap.group_search_filter must contain {user_dn}")
             env_ldap_password = os.environ.get("VIBE_LDAP_BIND_PASSWORD")
             if env_ldap_password:
                 ldap_cfg["bind_password"] = env_ldap_password
                 logger.info("Using LDAP bind_password from VIBE_LDAP_BIND_PASSWORD environment variable")
 
+        self._config_mtime_ns = mtime_ns
         return config
 
     def reload_config(self) -> None:
-        """Hot-reload auth.yaml (e.g. after edit_user.py changes)."""
+        """Hot-reload auth.yaml (e.g. after edit_user.py changes).
+
+        Does nothing if the file is unchanged since the last load.
+        """
         try:
+            if self._config_path.stat().st_mtime_ns == self._config_mtime_ns:
+                return
             self._config = self._load_config()
-            self._timeout = timedelta(
-                hours=self._config.get("session_timeout_hours", 24)
-            )
+            self._timeout_seconds = self._config.get("session_timeout_hours", 24) * 3600.0
+            self._dummy_hash = self._make_dummy_hash()
+            self._local_users = self._index_local_users()
             logger.info("Auth config reloaded")
         except Exception as e:
             logger.error("Failed to reload auth config: %s", e)
@@ -209,6 +263,24 @@ class AuthManager:
     # the username is valid, preventing user enumeration via timing.
     _DUMMY_HASH = "$2b$12$000000000000000000000uKoqMVCTTroULWJLFy6UaGfYXMqNJSdq"
 
+    def _make_dummy_hash(self) -> bytes:
+        """Get a dummy hash at the configured bcrypt cost, so the timing matches real users."""
+        cost = self._config.get("bcrypt_cost", DEFAULT_BCRYPT_COST)
+        if cost == DEFAULT_BCRYPT_COST:
+            return self._DUMMY_HASH.encode("utf-8")
+        return bcrypt.hashpw(b"dummy", bcrypt.gensalt(rounds=cost))
+
+    def _index_local_users(self) -> dict[str, bytes]:
+        """Map each local username to its encoded password hash (empty if missing)."""
+        users = self._config.get("users") or {}
+        index = {}
+        for name, info in users.items():
+            if info is not None and not isinstance(info, dict):
+                logger.warning("Ignoring local user %r: entry is not a mapping", name)
+                continue
+            index[name] = str((info or {}).get("password_hash", "")).encode("utf-8")
+        return index
+
     def authenticate(self, username: str, password: str) -> bool:
         """
         Authenticate a user against local users, then LDAP.
@@ -216,22 +288,30 @@ class AuthManager:
         Returns True if credentials are valid.
         Uses constant-time comparison to prevent user enumeration.
         """
-        if not username or not password:
+        if (not username or not password
+                or len(username) > MAX_USERNAME_LENGTH or len(password) > MAX_PASSWORD_LENGTH):
             # Still do a dummy check to prevent timing leak
-            bcrypt.checkpw(b"dummy", self._DUMMY_HASH.encode("utf-8"))
+            bcrypt.checkpw(b"dummy", self._dummy_hash)
             return False
 
+        # bcrypt looks at no more than 72 bytes (bcrypt>=5 raises on more) and
+        # edit_user.py refuses longer passwords, so no local hash matches one.
+        # LDAP has no such limit and gets the password as typed.
+        password_bytes = password.encode("utf-8")
+        bcrypt_password = password_bytes if len(password_bytes) <= BCRYPT_MAX_PASSWORD_BYTES else None
+
         # 1. Check local users first
-        users = self._config.get("users") or {}
-        if username in users:
-            stored_hash = users[username].get("password_hash", "")
+        stored_hash = self._local_users.get(username)
+        if stored_hash is not None:
+            if bcrypt_password is None:
+                bcrypt.checkpw(b"dummy", self._dummy_hash)
+                return False
             try:
-                return bcrypt.checkpw(
-                    password.encode("utf-8"),
-                    stored_hash.encode("utf-8"),
-                )
+                return bcrypt.checkpw(bcrypt_password, stored_hash)
             except (ValueError, TypeError):
                 logger.warning("Invalid password hash for local user '%s'", username)
+                # A malformed hash fails instantly; pay the bcrypt cost anyway
+                bcrypt.checkpw(bcrypt_password, self._dummy_hash)
                 return False
 
         # 2. Try LDAP if enabled
@@ -240,7 +320,7 @@ class AuthManager:
             return self._ldap_authenticate(username, password, ldap_cfg)
 
         # User not found - do dummy bcrypt check to prevent timing-based enumeration
-        bcrypt.checkpw(password.encode("utf-8"), self._DUMMY_HASH.encode("utf-8"))
+        bcrypt.checkpw(bcrypt_password or b"dummy", self._dummy_hash)
         return False
 
     # ------------------------------------------------------------------
@@ -259,7 +339,7 @@ class AuthManager:
         """
         try:
             import ldap3
-            from ldap3 import Server, Connection, Tls, ALL
+            from ldap3 import Server, Connection, Tls, NONE
             import ssl as _ssl
         except ImportError:
             logger.error(
@@ -270,17 +350,17 @@ class AuthManager:
 
         server_url = cfg.get("server_url", "")
         timeout = cfg.get("timeout", 10)
-
-        # TLS configuration
-        tls_config = None
-        if cfg.get("tls_verify", True):
-            tls_config = Tls(validate=_ssl.CERT_REQUIRED)
-        else:
-            tls_config = Tls(validate=_ssl.CERT_NONE)
+        tls_verify = cfg.get("tls_verify", True)
 
         try:
-            server = Server(server_url, get_info=ALL, tls=tls_config,
-                            connect_timeout=timeout)
+            # Reuse the Server while its settings are unchanged. Nothing reads
+            # the server's schema or DSE info, so don't fetch it on bind.
+            settings = (server_url, tls_verify, timeout)
+            if self._ldap_server is None or self._ldap_server[0] != settings:
+                tls_config = Tls(validate=_ssl.CERT_REQUIRED if tls_verify else _ssl.CERT_NONE)
+                self._ldap_server = (settings, Server(server_url, get_info=NONE, tls=tls_config,
+                                                      connect_timeout=timeout))
+            server = self._ldap_server[1]
 
             # Step 1: Bind with service account
             bind_dn = cfg.get("bind_dn", "")
@@ -304,7 +384,8 @@ class AuthManager:
             safe_username = ldap3.utils.conv.escape_filter_chars(username)
             resolved_filter = search_filter.replace("{username}", safe_username)
 
-            conn.search(search_base, resolved_filter, attributes=["*"])
+            # Only the entry DN is used, so don't transfer any attributes
+            conn.search(search_base, resolved_filter, attributes=ldap3.NO_ATTRIBUTES)
 
             if not conn.entries:
                 logger.info("LDAP user not found: '%s'", username)
@@ -360,13 +441,14 @@ class AuthManager:
     # Sessions
     # ------------------------------------------------------------------
 
+    def _token_key(self, token: str) -> bytes:
+        """Get the session store key for a token."""
+        return hmac.new(self._token_secret, token.encode("utf-8"), hashlib.sha256).digest()
+
     def create_session(self, username: str) -> str:
         """Create a new login session. Returns the session token."""
         token = secrets.token_urlsafe(32)
-        self._sessions[token] = {
-            "username": username,
-            "created_at": datetime.now(),
-        }
+        self._sessions[self._token_key(token)] = LoginSession(username=username, created_at=time.monotonic())
         logger.info("Session created for user '%s'", username)
         return token
 
@@ -379,27 +461,31 @@ class AuthManager:
         """
         if not token:
             return None
-        session = self._sessions.get(token)
+        key = self._token_key(token)
+        session = self._sessions.get(key)
         if not session:
             return None
-        if datetime.now() - session["created_at"] > self._timeout:
-            del self._sessions[token]
+        if time.monotonic() - session.created_at > self._timeout_seconds:
+            del self._sessions[key]
             return None
-        return session["username"]
+        return session.username
 
     def destroy_session(self, token: str) -> None:
         """Remove a session (logout)."""
-        self._sessions.pop(token, None)
+        self._sessions.pop(self._token_key(token), None)
 
     def cleanup_expired_sessions(self) -> int:
         """Remove all expired sessions. Returns count removed."""
-        now = datetime.now()
-        expired = [
-            tok for tok, sess in self._sessions.items()
-            if now - sess["created_at"] > self._timeout
-        ]
-        for tok in expired:
-            del self._sessions[tok]
+        # Tokens are kept in creation order, so the expired ones are a
+        # prefix of the dict and the scan stops at the first live session
+        now = time.monotonic()
+        expired = []
+        for key, sess in self._sessions.items():
+            if now - sess.created_at <= self._timeout_seconds:
+                break
+            expired.append(key)
+        for key in expired:
+            del self._sessions[key]
         return len(expired)
 
 
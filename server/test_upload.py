@@ -0,0 +1,98 @@
+"""Tests for the streaming file upload endpoint.
+
+Run from the server directory: python3 -m unittest test_upload
+"""
+
+import errno
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import app
+
+URL = "/session/test-session/upload"
+
+
+class UploadTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.base = Path(self._tmp.name) / "workspaces"
+        self.workspace = self.base / "test-session"
+        self.workspace.mkdir(parents=True)
+        self._saved = (app.owner_store, dict(app.session_manager._sessions))
+        self._base_patch = mock.patch.object(app, "WORKSPACE_BASE", self.base)
+        self._base_patch.start()
+        app.owner_store = app.SessionOwnerStore(Path(self._tmp.name) / "owners.json")
+        app.owner_store._owners["test-session"] = "__anonymous__"
+        session = app.Session("test-session", workspace=str(self.workspace), port=0)
+        session._state = app.SessionState.READY
+        app.session_manager._sessions["test-session"] = session
+        self.client = TestClient(app.app)
+
+    def tearDown(self):
+        self._base_patch.stop()
+        app.owner_store, sessions = self._saved
+        app.session_manager._sessions.clear()
+        app.session_manager._sessions.update(sessions)
+        self._tmp.cleanup()
+
+    def assertNoTempFiles(self):
+        self.assertEqual(list(self.base.glob(".upload-*")), [])
+
+    def test_nested_path_creates_directories(self):
+        response = self.client.post(URL, files={"file": ("c.txt", b"hello")},
+                                    data={"path": "a/b/c.txt"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["size"], 5)
+        self.assertEqual((self.workspace / "a" / "b" / "c.txt").read_bytes(), b"hello")
+        self.assertNoTempFiles()
+
+    def test_missing_file_part(self):
+        response = self.client.post(URL, files={"path": (None, "x.txt")})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["detail"], "No file uploaded")
+        self.assertNoTempFiles()
+
+    def test_oversized_field_is_rejected(self):
+        response = self.client.post(URL, files={"file": ("x.txt", b"data")},
+                                    data={"path": "x" * (app.UploadReceiver.MAX_FIELD_SIZE + 1)})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("too large", response.json()["detail"])
+        self.assertNoTempFiles()
+
+    def test_malformed_body_is_rejected(self):
+        body = (b"--xyz\r\nContent-Disposition: form-data; name=\"file\"; filename=\"x.txt\"\r\n\r\n"
+                b"data\r\n--xyzgarbage")
+        response = self.client.post(URL, content=body,
+                                    headers={"Content-Type": "multipart/form-data; boundary=xyz"})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse((self.workspace / "x.txt").exists())
+        self.assertNoTempFiles()
+
+    def test_temp_file_removed_when_move_fails(self):
+        (self.workspace / "taken").mkdir()
+        response = self.client.post(URL, files={"file": ("taken", b"data")})
+        self.assertEqual(response.status_code, 500)
+        self.assertNoTempFiles()
+
+    def test_workspace_on_another_filesystem(self):
+        replace = os.replace
+
+        def cross_device_replace(src, dst):
+            if Path(src).name.startswith(".upload-"):
+                raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+            replace(src, dst)
+
+        with mock.patch.object(app.os, "replace", cross_device_replace):
+            response = self.client.post(URL, files={"file": ("x.txt", b"data")})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((self.workspace / "x.txt").read_bytes(), b"data")
+        self.assertNoTempFiles()
+
+
+if __name__ == "__main__":
+    unittest.main()
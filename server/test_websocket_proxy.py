@@ -0,0 +1,121 @@
+"""Tests for the ttyd WebSocket proxy.
+
+Run from the server directory: python3 -m unittest test_websocket_proxy
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import websockets
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocket
+
+import app
+
+
+class FakeTtyd:
+    """A ttyd stand-in that sends a fixed list of messages, then closes.
+
+    A float in the list is a pause of that many seconds instead of a message.
+    """
+
+    def __init__(self, messages: list):
+        self.messages = messages
+        self.port = None
+        self._ready = threading.Event()
+        self._stop = None
+        self._thread = threading.Thread(target=asyncio.run, args=(self._serve(),), daemon=True)
+
+    async def _handler(self, ws):
+        await ws.recv()  # The browser's auth message
+        for message in self.messages:
+            if isinstance(message, float):
+                await asyncio.sleep(message)
+            else:
+                await ws.send(message)
+        await ws.close()
+
+    async def _serve(self):
+        self._stop = asyncio.get_running_loop().create_future()
+        async with websockets.serve(self._handler, "127.0.0.1", 0, subprotocols=["tty"]) as server:
+            self.port = server.sockets[0].getsockname()[1]
+            self._ready.set()
+            await self._stop
+
+    def __enter__(self):
+        self._thread.start()
+        self._ready.wait(5)
+        return self
+
+    def __exit__(self, *exc):
+        loop = self._stop.get_loop()
+        loop.call_soon_threadsafe(self._stop.set_result, None)
+        self._thread.join(5)
+
+
+class WebSocketProxyTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._saved = (app.owner_store, dict(app.session_manager._sessions))
+        app.owner_store = app.SessionOwnerStore(Path(self._tmp.name) / "owners.json")
+        app.owner_store._owners["test-session"] = "__anonymous__"
+
+    def tearDown(self):
+        app.owner_store, sessions = self._saved
+        app.session_manager._sessions.clear()
+        app.session_manager._sessions.update(sessions)
+        self._tmp.cleanup()
+
+    def _relay(self, messages: list) -> list:
+        """Proxy messages from a fake ttyd and return what the browser received."""
+        with FakeTtyd(messages) as ttyd:
+            session = app.Session("test-session", workspace=self._tmp.name, port=ttyd.port)
+            session._state = app.SessionState.READY
+            app.session_manager._sessions["test-session"] = session
+
+            received = []
+            with TestClient(app.app).websocket_connect("/ttyd/test-session/ws", subprotocols=["tty"]) as ws:
+                ws.send_text('{"AuthToken": ""}')
+                while True:
+                    message = ws.receive()
+                    if message["type"] == "websocket.close":
+                        break
+                    received.append(message.get("bytes", message.get("text")))
+            return received
+
+    def test_output_before_close_reaches_browser(self):
+        # Hold up the first browser send so the remaining frames and ttyd's
+        # close are all buffered by the time the proxy drains them
+        send_bytes = WebSocket.send_bytes
+        first = []
+
+        async def slow_send_bytes(ws, data):
+            if not first:
+                first.append(data)
+                await asyncio.sleep(0.2)
+            await send_bytes(ws, data)
+
+        frames = [b"0" + f"line {i}\r\n".encode() for i in range(5)]
+        with mock.patch.object(WebSocket, "send_bytes", slow_send_bytes):
+            received = self._relay(frames[:1] + [0.05] + frames[1:])
+        output = b"".join(m[1:] for m in received if isinstance(m, bytes))
+        self.assertEqual(output, b"".join(f[1:] for f in frames))
+
+    def test_merged_frames_stay_within_batch_limit(self):
+        frames = [b"0" + b"x" * 1000 for _ in range(300)]
+        received = self._relay(frames)
+        self.assertTrue(all(len(m) - 1 <= app.WS_BATCH_MAX_BYTES for m in received))
+        self.assertEqual(sum(len(m) - 1 for m in received), 300 * 1000)
+
+    def test_non_output_messages_keep_their_order(self):
+        received = self._relay([b"0abc", "text", b"0def", b"1title"])
+        self.assertEqual(received, [b"0abc", "text", b"0def", b"1title"])
+
+
+if __name__ == "__main__":
+    unittest.main()